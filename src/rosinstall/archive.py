@@ -0,0 +1,195 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Source archive downloads of pinned versions, for workspaces that never
+need VCS metadata. The result is a vcstools tar checkout, so wstool
+and rosws treat it like any 'tar' entry.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tarfile
+import yaml
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+ARCHIVE_CACHE_ENV = 'ROSINSTALL_ARCHIVE_CACHE'
+DEFAULT_ARCHIVE_CACHE = os.path.join('~', '.ros', 'rosinstall', 'archives')
+# same as vcstools.tar
+_METADATA_FILENAME = '.tar'
+
+_HOST_PATTERNS = [
+    # (host, archive url format from repository url and version)
+    ('github.com', '%(repo)s/archive/%(version)s.tar.gz'),
+    ('gitlab.com', '%(repo)s/-/archive/%(version)s/%(name)s-%(version)s.tar.gz'),
+    ('bitbucket.org', '%(repo)s/get/%(version)s.tar.gz'),
+]
+
+
+def get_archive_url(uri, version):
+    """
+    :returns: url of a tar.gz archive of version for repositories on
+      known hosting sites, else None
+    """
+    if not uri or not version:
+        return None
+    match = (re.match(r'^(?:https?|git|ssh)://(?:[^@/]*@)?([^/:]+)(?::\d+)?/(.+?)(?:\.git)?/?$', uri) or
+             re.match(r'^[^@/]+@([^:/]+):(.+?)(?:\.git)?/?$', uri))
+    if not match:
+        return None
+    host, repo_path = match.groups()
+    for known_host, url_format in _HOST_PATTERNS:
+        if host.lower() == known_host:
+            return url_format % {'repo': 'https://%s/%s' % (known_host, repo_path),
+                                 'name': repo_path.split('/')[-1],
+                                 'version': version}
+    return None
+
+
+def get_archive_cache_dir():
+    """
+    :returns: $ROSINSTALL_ARCHIVE_CACHE or ~/.ros/rosinstall/archives
+    """
+    return os.path.expanduser(os.environ.get(ARCHIVE_CACHE_ENV, DEFAULT_ARCHIVE_CACHE))
+
+
+def get_archive_checkout(path):
+    """
+    :returns: (url, version) of the tar checkout at path, or None
+    """
+    metadata_path = os.path.join(path, _METADATA_FILENAME)
+    if not os.path.isfile(metadata_path):
+        return None
+    with open(metadata_path, 'r') as metadata_file:
+        metadata = yaml.safe_load(metadata_file)
+    if type(metadata) != dict:
+        return None
+    return metadata.get('url'), metadata.get('version')
+
+
+class _TeeReader(object):
+    """Copies what is read from fileobj to out"""
+
+    def __init__(self, fileobj, out):
+        self.fileobj = fileobj
+        self.out = out
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.out.write(data)
+        return data
+
+
+def _extract_stream(fileobj, path):
+    """
+    Extracts a tar stream into path, stripping the top level directory
+    all source archives have.
+
+    :returns: name of the top level directory
+    """
+    top_dir = None
+    archive = tarfile.open(fileobj=fileobj, mode='r|*')
+    for member in archive:
+        parts = member.name.split('/', 1)
+        if top_dir is None:
+            top_dir = parts[0]
+        if parts[0] != top_dir:
+            raise tarfile.TarError("Archive has several top level entries: %s, %s" %
+                                   (top_dir, parts[0]))
+        if len(parts) < 2 or not parts[1]:
+            continue
+        member.name = parts[1]
+        if member.islnk():
+            member.linkname = member.linkname.split('/', 1)[-1]
+        if (os.path.isabs(member.name) or
+                '..' in member.name.split('/')):
+            raise tarfile.TarError("Unsafe path in archive: %s" % member.name)
+        if hasattr(tarfile, 'data_filter'):
+            archive.extract(member, path, filter='data')
+        else:
+            archive.extract(member, path)
+    archive.close()
+    if top_dir is None:
+        raise tarfile.TarError("Empty archive")
+    return top_dir
+
+
+def fetch_archive(url, path, cache_dir=None):
+    """
+    Downloads the archive at url and extracts it into path while
+    downloading. With cache_dir, the archive is also written there
+    and later calls for the same url are served from it.
+
+    :returns: name of the top level directory of the archive, which
+      vcstools' tar client expects as version
+    :raises: EnvironmentError, tarfile.TarError
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.tar')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    try:
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as cached:
+                top_dir = _extract_stream(cached, path)
+        elif cache_path is None:
+            top_dir = _extract_stream(urlopen(url), path)
+        else:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = '%s.tmp%s' % (cache_path, os.getpid())
+            try:
+                with open(tmp_path, 'wb') as out:
+                    tee = _TeeReader(urlopen(url), out)
+                    top_dir = _extract_stream(tee, path)
+                    # the rest of the stream, e.g. padding
+                    while tee.read(65536):
+                        pass
+                os.rename(tmp_path, cache_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    except Exception:
+        shutil.rmtree(path)
+        raise
+    with open(os.path.join(path, _METADATA_FILENAME), 'w') as metadata_file:
+        metadata_file.write(yaml.safe_dump({'url': url, 'version': top_dir},
+                                           default_flow_style=False))
+    return top_dir
@@ -32,9 +32,14 @@
 
 # Author: kwc
 
+from multiprocessing.pool import ThreadPool
+
+import os
 import rosdistro
+from rosdistro.distribution_file import create_distribution_file
 from rosdistro.manifest_provider import get_release_tag
 from rospkg import distro as rospkg_distro
+from catkin_pkg.package import parse_package_string
 import yaml
 try:
     from urllib.request import urlopen
@@ -44,6 +49,13 @@ except ImportError:
 BRANCH_RELEASE = 'release'
 BRANCH_DEVEL = 'devel'
 
+# package.xml dependency tags that are needed to build from source
+_DEPENDENCY_TYPES = ['buildtool_depends', 'build_depends',
+                     'build_export_depends', 'exec_depends', 'run_depends']
+
+# parsed release dependencies, keyed by (distro name, package name)
+_release_deps_cache = {}
+
 
 class InvalidData(Exception):
     pass
@@ -195,11 +207,86 @@ def _get_electric_rosinstall(name, prefix=None):
     return None
 
 
-def _get_rosdistro_release(distro):
-    index = rosdistro.get_index(rosdistro.get_index_url())
+def _get_rosdistro_release(distro, index=None):
+    if index is None:
+        index = rosdistro.get_index(rosdistro.get_index_url())
     return rosdistro.get_distribution_file(index, distro)
 
 
+def _load_release_snapshot(distro, index=None):
+    """
+    Load a release file given either a distro name or the path or
+    url of a distribution.yaml snapshot.
+    """
+    if os.path.isfile(distro) or '://' in distro:
+        if os.path.isfile(distro):
+            with open(distro, 'r') as fhand:
+                data = yaml.safe_load(fhand)
+        else:
+            data = yaml.safe_load(urlopen(distro))
+        return create_distribution_file(data.get('name', distro), data)
+    return _get_rosdistro_release(distro, index)
+
+
+def index_release_repositories(release_file):
+    """
+    :returns: dict {repo_name: (uri, version)} for all released repositories
+    """
+    result = {}
+    for repo_name, repo in release_file.repositories.items():
+        release_repo = repo.release_repository
+        if release_repo is not None and release_repo.version:
+            result[repo_name] = (release_repo.url, release_repo.version)
+    return result
+
+
+def diff_release_indexes(old_index, new_index):
+    """
+    Compare two results of index_release_repositories.
+
+    :returns: (added, removed, changed), added and removed map repo
+      names to (uri, version), changed maps repo names to ((uri,
+      version), (uri, version)) old and new
+    """
+    added = {}
+    removed = {}
+    changed = {}
+    for repo_name, entry in new_index.items():
+        old_entry = old_index.get(repo_name)
+        if old_entry is None:
+            added[repo_name] = entry
+        elif old_entry != entry:
+            changed[repo_name] = (old_entry, entry)
+    for repo_name, entry in old_index.items():
+        if repo_name not in new_index:
+            removed[repo_name] = entry
+    return added, removed, changed
+
+
+def get_release_diff(old_distro, new_distro):
+    """
+    Compare the released repositories of two distros, each given by
+    name or by path or url of a distribution.yaml snapshot. Both
+    release files are downloaded in parallel, once.
+
+    :returns: (added, removed, changed) as in diff_release_indexes
+    """
+    index = None
+    distros = [old_distro, new_distro]
+    if not all([os.path.isfile(d) or '://' in d for d in distros]):
+        index = rosdistro.get_index(rosdistro.get_index_url())
+    pool = ThreadPool(2)
+    try:
+        old_index, new_index = pool.map(
+            lambda distro: index_release_repositories(
+                _load_release_snapshot(distro, index)),
+            distros)
+    finally:
+        pool.close()
+        pool.join()
+    return diff_release_indexes(old_index, new_index)
+
+
 def _find_repo(release_file, name):
     for r in release_file.repositories:
         repo = release_file.repositories[r]
@@ -269,6 +356,96 @@ def get_release_info(name, distro, prefix=None):
     return None
 
 
+def _get_release_package_deps(distribution, name):
+    """
+    Get the names of the released packages the package depends on,
+    memoized per distribution.
+    """
+    key = (distribution.name, name)
+    if key not in _release_deps_cache:
+        deps = set()
+        package_xml = distribution.get_release_package_xml(name)
+        if package_xml:
+            package = parse_package_string(package_xml)
+            for dep_type in _DEPENDENCY_TYPES:
+                for dep in getattr(package, dep_type, None) or []:
+                    deps.add(dep.name)
+        # only keep released packages, drop system dependencies
+        _release_deps_cache[key] = sorted(
+            [dep for dep in deps if dep in distribution.release_packages])
+    return _release_deps_cache[key]
+
+
+def get_release_dependency_closure(distribution, names, num_threads=8):
+    """
+    Compute the transitive closure of released packages needed to
+    build the given packages from source. Missing package.xml files
+    are fetched concurrently, one dependency level at a time.
+
+    :param distribution: rosdistro distribution (cache)
+    :param names: package names to start from
+    :param num_threads: how many package.xml files to fetch in parallel
+    :returns: set of package names, including names
+    """
+    closure = set()
+    pending = set(names)
+    pool = ThreadPool(max(1, num_threads))
+    try:
+        while pending:
+            closure.update(pending)
+            level = sorted(pending)
+            deps_list = pool.map(
+                lambda pkg: _get_release_package_deps(distribution, pkg),
+                level)
+            pending = set()
+            for deps in deps_list:
+                pending.update([dep for dep in deps if dep not in closure])
+    finally:
+        pool.close()
+        pool.join()
+    return closure
+
+
+def build_release_closure_rosinstall(distribution, names, prefix=None):
+    """
+    Build a rosinstall for released packages, one entry per package,
+    grouped by repository as in get_release_rosinstall.
+    """
+    repositories = {}
+    for name in names:
+        repo_name = distribution.release_packages[name].repository_name
+        repositories.setdefault(repo_name, []).append(name)
+    rosinstall = []
+    for repo_name in sorted(repositories.keys()):
+        repo = distribution.repositories[repo_name].release_repository
+        pkg_prefix = '/'.join([prefix, repo_name]) if prefix else repo_name
+        for pkg in sorted(repositories[repo_name]):
+            rosinstall.extend(build_rosinstall(
+                pkg, repo.url, 'git', get_release_tag(repo, pkg), pkg_prefix))
+    return rosinstall
+
+
+def get_release_deps_info(name, distro, prefix=None):
+    """
+    Get a rosinstall of the latest release of a package, metapackage
+    or repository together with all released packages it depends on
+    transitively, using the package.xml files of the distribution
+    cache.
+    """
+    index = rosdistro.get_index(rosdistro.get_index_url())
+    distribution = rosdistro.get_cached_distribution(index, distro,
+                                                     allow_lazy_load=True)
+    if name in distribution.release_packages:
+        names = [name]
+    elif (name in distribution.repositories and
+          distribution.repositories[name].release_repository is not None):
+        names = distribution.repositories[name].release_repository.package_names
+    else:
+        return None
+    closure = get_release_dependency_closure(distribution, names)
+    return build_release_closure_rosinstall(distribution, closure, prefix)
+
+
 def get_doc_info(name, distro, prefix=None):
     doc_yaml = get_manifest_yaml(name, distro)
     return build_rosinstall(
@@ -0,0 +1,129 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Durations of past checkouts and updates in a workspace, used to start
+the longest jobs of parallel installs first, so that a single large
+repository does not start last and delay the whole run.
+"""
+
+import json
+import numbers
+import os
+import threading
+
+DURATIONS_FILENAME = '.rosinstall.durations'
+# estimates in seconds with no history in the workspace at all
+DEFAULT_ESTIMATES = {'checkout': 30.0, 'update': 5.0}
+# weight of a new measurement against the previous estimate
+SMOOTHING = 0.5
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _is_duration(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _get_valid_entries(data):
+    """
+    :returns: the entries of data that are dicts, with only the uri
+      and durations that are numbers
+    """
+    entries = {}
+    for local_name, entry in data.items():
+        if type(entry) != dict:
+            continue
+        entries[local_name] = dict([(key, value) for key, value in entry.items()
+                                    if key == 'uri' or _is_duration(value)])
+    return entries
+
+
+class DurationHistory(object):
+    """
+    Per local name and action ('checkout' or 'update') estimate of the
+    duration, smoothed over runs and discarded when the uri changes.
+    """
+
+    def __init__(self, base_path):
+        self.path = os.path.join(base_path, DURATIONS_FILENAME)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r') as fhand:
+                    data = json.load(fhand)
+                if type(data) == dict:
+                    self.entries = _get_valid_entries(data)
+            except (IOError, ValueError):
+                # a broken history only costs scheduling quality
+                pass
+
+    def get_estimate(self, local_name, uri, action):
+        """
+        :returns: expected duration in seconds, for entries without
+          history the median of other entries' same action
+        """
+        entry = self.entries.get(local_name)
+        if entry is not None and entry.get('uri') == uri and action in entry:
+            return entry[action]
+        known = [other[action] for other in self.entries.values() if action in other]
+        if known:
+            return _median(known)
+        return DEFAULT_ESTIMATES.get(action, 0.0)
+
+    def record(self, local_name, uri, action, duration):
+        with self._lock:
+            entry = self.entries.get(local_name)
+            if entry is None or entry.get('uri') != uri:
+                entry = self.entries[local_name] = {'uri': uri}
+            if action in entry:
+                duration = SMOOTHING * duration + (1 - SMOOTHING) * entry[action]
+            entry[action] = duration
+
+    def save(self):
+        with self._lock:
+            tmp_path = '%s.tmp%s' % (self.path, os.getpid())
+            try:
+                with open(tmp_path, 'w') as fhand:
+                    json.dump(self.entries, fhand, indent=1, sort_keys=True)
+                os.rename(tmp_path, self.path)
+            except (IOError, OSError):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
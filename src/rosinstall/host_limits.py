@@ -0,0 +1,106 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Limits for concurrent checkouts and updates per host, so that a high
+-j does not flood a single server with connections. The limits file is
+a yaml dict of host name to limit::
+
+  github.com: 8
+  git.example.lan: 2
+"""
+
+import os
+import yaml
+
+from wstool.common import MultiProjectException
+
+from rosinstall.parallel import KeyLimiter
+from rosinstall.profiling import get_uri_host
+
+HOST_LIMITS_ENV = 'ROSINSTALL_HOST_LIMITS'
+DEFAULT_HOST_LIMITS = os.path.join('~', '.ros', 'rosinstall', 'host_limits.yaml')
+
+
+def load_host_limits(path=None):
+    """
+    :param path: limits file, defaults to $ROSINSTALL_HOST_LIMITS or
+      ~/.ros/rosinstall/host_limits.yaml
+    :returns: dict of host to limit, empty if there is no limits file
+    :raises: MultiProjectException for invalid limits files
+    """
+    if path is None:
+        path = os.environ.get(HOST_LIMITS_ENV, DEFAULT_HOST_LIMITS)
+    path = os.path.expanduser(path)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as limits_file:
+        try:
+            data = yaml.safe_load(limits_file)
+        except yaml.YAMLError as yame:
+            raise MultiProjectException("Invalid yaml in %s: %s" % (path, yame))
+    if data is None:
+        return {}
+    if type(data) != dict:
+        raise MultiProjectException("Invalid host limits in %s, need a dict of host to limit" % path)
+    limits = {}
+    for host, limit in data.items():
+        if type(limit) != int or limit < 1:
+            raise MultiProjectException(
+                "Invalid limit for host %s in %s, need a positive number: %s" % (host, path, limit))
+        limits[str(host).lower()] = limit
+    return limits
+
+
+def get_host_limiter(reports, jobs_per_host=None, host_limits=None, rewriter=None):
+    """
+    :param reports: install reports of the elements to limit, or the
+      config elements themselves
+    :param jobs_per_host: limit for hosts not in host_limits
+    :param host_limits: dict of host to limit
+    :param rewriter: UriRewriter, hosts are those fetched from
+    :returns: KeyLimiter for the reports by host of their uri, None if
+      no limits are given
+    """
+    if jobs_per_host is None and not host_limits:
+        return None
+    hosts = {}
+    for report in reports:
+        element = getattr(report, 'config_element', report)
+        uri = element.get_path_spec().get_uri()
+        if rewriter is not None:
+            uri = rewriter.rewrite(uri)[0]
+        hosts[id(report)] = get_uri_host(uri)
+    return KeyLimiter(lambda report: hosts.get(id(report)),
+                      limits=host_limits,
+                      default_limit=jobs_per_host)
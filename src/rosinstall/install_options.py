@@ -0,0 +1,106 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Command line options shared by the commands that install or fetch
+workspace entries.
+"""
+
+from rosinstall.watchdog import DEFAULT_RETRIES
+
+
+def add_install_options(parser, fetch=False, workspace=True):
+    """
+    Adds the options for host limits, timeouts, caches and profiling
+    to an optparse parser.
+
+    :param fetch: for commands that only download, without --archive
+    :param workspace: also add the options only available for
+      workspaces, --jobs-per-host, --profile and --trace
+    """
+    if workspace:
+        parser.add_option("--jobs-per-host", dest="jobs_per_host", default=None, type=int,
+                          help="How many parallel threads to use per host, limits for single hosts can be set in ~/.ros/rosinstall/host_limits.yaml",
+                          action="store")
+    parser.add_option("--inactivity-timeout", dest="inactivity_timeout", default=None, type=float,
+                      help="Kill and retry the SCM processes of an entry that made no progress for this many seconds",
+                      action="store")
+    parser.add_option("--entry-timeout", dest="entry_timeout", default=None, type=float,
+                      help="Kill and retry the SCM processes of an entry that takes longer than this many seconds",
+                      action="store")
+    parser.add_option("--retries", dest="retries", default=DEFAULT_RETRIES, type=int,
+                      help="How often to retry entries that timed out, default %d" % DEFAULT_RETRIES,
+                      action="store")
+    if fetch:
+        parser.add_option("--cache-dir", dest="cache_dir", default=None,
+                          help="Also fetch into the bare mirrors in this machine-wide cache directory, defaults to $ROSINSTALL_CACHE_DIR",
+                          action="store")
+    else:
+        parser.add_option("--archive", dest="archive", default=False,
+                          help="Download source archives of pinned git entries instead of cloning, where the host provides them",
+                          action="store_true")
+        parser.add_option("--cache-dir", dest="cache_dir", default=None,
+                          help="Clone git entries from bare mirrors in this machine-wide cache directory, defaults to $ROSINSTALL_CACHE_DIR",
+                          action="store")
+    if workspace:
+        parser.add_option("--profile", dest="profile", default=None,
+                          help="Write wall and CPU time per phase and per entry as JSON to this file",
+                          action="store")
+        parser.add_option("--trace", dest="trace", default=None,
+                          help="Write a Chrome trace of phases and entries per thread to this file",
+                          action="store")
+
+
+def get_install_mode(parser, options):
+    """
+    :returns: how to handle checkouts with changed uris, 'prompt',
+      'delete', 'abort' or 'backup', from the --delete-changed-uris,
+      --abort-changed-uris and --backup-changed-uris options
+    """
+    mode = 'prompt'
+    if options.delete_changed:
+        mode = 'delete'
+    if options.abort_changed:
+        if mode == 'delete':
+            parser.error(
+                "delete-changed-uris is mutually exclusive with abort-changed-uris")
+        mode = 'abort'
+    if options.backup_changed != '':
+        if mode == 'delete':
+            parser.error(
+                "delete-changed-uris is mutually exclusive with backup-changed-uris")
+        if mode == 'abort':
+            parser.error(
+                "abort-changed-uris is mutually exclusive with backup-changed-uris")
+        mode = 'backup'
+    return mode
@@ -0,0 +1,169 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Journal of an install run in the workspace, so that an interrupted
+run can be resumed without fetching the entries it completed again.
+Each line is a json record, written as the run progresses. Only the
+outcomes of entries and the start and end of the run are synced to
+disk, a lost begin record just means its entry is not reverified.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+import vcstools
+
+JOURNAL_FILENAME = '.rosinstall.journal'
+
+
+class InstallJournal(object):
+
+    def __init__(self, base_path):
+        self.path = os.path.join(base_path, JOURNAL_FILENAME)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def read_interrupted(self):
+        """
+        :returns: (completed, in_flight) dicts of local name to the
+          journal record of the last run, None if that run finished
+          or there is no journal
+        """
+        if not os.path.isfile(self.path):
+            return None
+        completed = {}
+        in_flight = {}
+        with open(self.path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line cut off by the interruption
+                    continue
+                event = record.get('event')
+                name = record.get('local-name')
+                if event == 'finish':
+                    return None
+                elif event == 'begin':
+                    in_flight[name] = record
+                elif event == 'done':
+                    in_flight.pop(name, None)
+                    completed[name] = record
+                elif event == 'failed':
+                    in_flight.pop(name, None)
+        return completed, in_flight
+
+    def start(self, resume=False):
+        """
+        Opens the journal, a new run overwrites it, a resumed run appends.
+        """
+        self._file = open(self.path, 'a' if resume else 'w')
+        self._write({'event': 'resume' if resume else 'start'}, sync=True)
+
+    def begin(self, element, checkout=False):
+        """
+        :param checkout: True once a fresh checkout into an empty path starts
+        """
+        self._write({'event': 'begin',
+                     'local-name': element.get_local_name(),
+                     'checkout': checkout})
+
+    def done(self, element):
+        path_spec = element.get_path_spec()
+        revision = None
+        if element.is_vcs_element() and os.path.isdir(element.get_path()):
+            revision = vcstools.get_vcs_client(
+                path_spec.get_scmtype(), element.get_path()).get_version()
+        self._write({'event': 'done',
+                     'local-name': element.get_local_name(),
+                     'uri': path_spec.get_uri(),
+                     'version': path_spec.get_version(),
+                     'revision': revision}, sync=True)
+
+    def failed(self, element):
+        self._write({'event': 'failed', 'local-name': element.get_local_name()},
+                    sync=True)
+
+    def finish(self):
+        self._write({'event': 'finish'}, sync=True)
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record, sync=False):
+        record['time'] = time.time()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+
+def is_completed(element, record):
+    """
+    :returns: True if the journal record shows element was installed
+      as currently configured
+    """
+    path_spec = element.get_path_spec()
+    return (record is not None and
+            record.get('uri') == path_spec.get_uri() and
+            record.get('version') == path_spec.get_version() and
+            os.path.exists(element.get_path()))
+
+
+def reverify_in_flight(element, record):
+    """
+    Removes what an interrupted fresh checkout left behind, unless it
+    is a complete checkout, so that the element gets checked out again.
+
+    :returns: True if the directory was removed
+    """
+    path = element.get_path()
+    if not (record.get('checkout') and element.is_vcs_element() and
+            os.path.isdir(path)):
+        return False
+    client = vcstools.get_vcs_client(element.get_path_spec().get_scmtype(), path)
+    if client.detect_presence() and client.get_version() is not None:
+        return False
+    shutil.rmtree(path)
+    return True
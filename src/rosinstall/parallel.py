@@ -0,0 +1,347 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2010, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Helpers to run IO-bound jobs (SCM calls, downloads) in a bounded
+number of threads while consuming the results in a stable order.
+"""
+
+import multiprocessing
+import sys
+import threading
+import time
+import traceback
+
+from vcstools.vcs_base import VcsError
+from wstool.common import MultiProjectException
+
+# -j value for AdaptiveLimiter
+AUTO_JOBS = 'auto'
+
+
+class WorkerPool(object):
+    """
+    Runs a function over items in up to num_threads threads. Unlike
+    wstool's DistributedWork, results are handed out as soon as they
+    (and all results for earlier items) are available, and items may
+    come from a lazy iterator, so work can start before all input is
+    known.
+
+    Limiters may hold back items, e.g. to cap jobs per host. They are
+    objects with methods can_start(item), get_cost(item) (the item with
+    the lowest summed cost among those allowed starts first),
+    started(item) and finished(item, error), all called under the lock
+    of the pool. Held back items are skipped for later ones, up to
+    lookahead items ahead of the last started one.
+    """
+
+    def __init__(self, num_threads=1, limiters=None, lookahead=64):
+        self.num_threads = max(1, int(num_threads))
+        self.limiters = limiters or []
+        self.lookahead = lookahead
+
+    def imap(self, func, items, max_pending=None):
+        """
+        Generator yielding tuples (item, result, error) in the order of
+        items. error is the exception raised by func(item), if any, in
+        which case result is None. Exceptions raised while iterating
+        over items are re-raised after all earlier results have been
+        yielded.
+
+        :param max_pending: if given, no new item is started while that
+          many results wait for an earlier one to be consumed, bounding
+          memory for large results such as diffs
+        """
+        if self.num_threads == 1:
+            for item in items:
+                yield _run_job(func, item)
+            return
+
+        items_iter = iter(items)
+        condition = threading.Condition()
+        results = {}
+        # pulled from items_iter but not started, ordered by index
+        pending = []
+        state = {'count': 0, 'consumed': 0, 'running': 0, 'total': None,
+                 'input_error': None, 'stop': False, 'pulling': False}
+
+        def choose():
+            # position in pending of the item to start next, or None
+            best = None
+            for position, (index, item) in enumerate(pending):
+                if max_pending is not None and index >= state['consumed'] + max_pending:
+                    break
+                # with nothing running, limiters must not stall the pool
+                if state['running'] > 0 and not all(
+                        [limiter.can_start(item) for limiter in self.limiters]):
+                    continue
+                cost = sum([limiter.get_cost(item) for limiter in self.limiters])
+                if best is None or cost < best[0]:
+                    best = (cost, position)
+            return None if best is None else best[1]
+
+        def next_job():
+            # (index, item) to work on, or None when done
+            while True:
+                with condition:
+                    while True:
+                        if state['stop']:
+                            return None
+                        position = choose()
+                        if position is not None:
+                            index, item = pending.pop(position)
+                            state['running'] += 1
+                            for limiter in self.limiters:
+                                limiter.started(item)
+                            return index, item
+                        if state['total'] is not None:
+                            if not pending:
+                                return None
+                        elif not state['pulling'] and len(pending) < self.lookahead:
+                            state['pulling'] = True
+                            break
+                        # timeout allows KeyboardInterrupt in python2
+                        condition.wait(1)
+                # pull without holding the lock, items may block, e.g.
+                # when read from stdin
+                item = error = None
+                exhausted = False
+                try:
+                    item = next(items_iter)
+                except StopIteration:
+                    exhausted = True
+                except Exception as exc:
+                    error = exc
+                with condition:
+                    state['pulling'] = False
+                    if exhausted or error is not None:
+                        state['input_error'] = error
+                        state['total'] = state['count']
+                    else:
+                        pending.append((state['count'], item))
+                        state['count'] += 1
+                    condition.notify_all()
+
+        def worker():
+            while True:
+                job = next_job()
+                if job is None:
+                    return
+                index, item = job
+                output = _run_job(func, item)
+                with condition:
+                    results[index] = output
+                    state['running'] -= 1
+                    for limiter in self.limiters:
+                        limiter.finished(item, output[2])
+                    condition.notify_all()
+
+        threads = []
+        for index in range(self.num_threads):
+            thread = threading.Thread(target=worker, name='worker-%d' % (index + 1))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        next_index = 0
+        try:
+            while True:
+                with condition:
+                    while (next_index not in results and
+                           (state['total'] is None or
+                            next_index < state['total'])):
+                        # timeout allows KeyboardInterrupt in python2
+                        condition.wait(1)
+                    if next_index not in results:
+                        break
+                    output = results.pop(next_index)
+                    state['consumed'] = next_index + 1
+                    condition.notify_all()
+                yield output
+                next_index += 1
+        finally:
+            with condition:
+                state['stop'] = True
+                condition.notify_all()
+        if state['input_error'] is not None:
+            raise state['input_error']
+
+    def map(self, func, items):
+        """
+        :returns: list of (item, result, error) in the order of items
+        """
+        return list(self.imap(func, items))
+
+
+class KeyLimiter(object):
+    """
+    WorkerPool limiter allowing at most a given number of concurrent
+    jobs per key of the items, e.g. per host. Among allowed items,
+    those whose key has the fewest running jobs start first, so work is
+    interleaved across keys.
+    """
+
+    def __init__(self, get_key, limits=None, default_limit=None):
+        """
+        :param get_key: function from item to key, None keys are not limited
+        :param limits: dict of key to limit
+        :param default_limit: limit for keys not in limits, None for no limit
+        """
+        self.get_key = get_key
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.running = {}
+
+    def can_start(self, item):
+        key = self.get_key(item)
+        if key is None:
+            return True
+        limit = self.limits.get(key, self.default_limit)
+        return limit is None or self.running.get(key, 0) < limit
+
+    def get_cost(self, item):
+        key = self.get_key(item)
+        if key is None:
+            return 0
+        return self.running.get(key, 0)
+
+    def started(self, item):
+        key = self.get_key(item)
+        self.running[key] = self.running.get(key, 0) + 1
+
+    def finished(self, item, error):
+        key = self.get_key(item)
+        self.running[key] -= 1
+
+
+class AdaptiveLimiter(object):
+    """
+    WorkerPool limiter adjusting the number of concurrent jobs (the
+    level) by additive increase, multiplicative decrease: after each
+    round of level finished jobs, the level rises by one unless the
+    rate of finished jobs dropped compared to the last round. A failed
+    job, which for checkouts and updates mostly means a connection
+    error or timeout, halves the level, once for all jobs that were
+    running at the time.
+    """
+
+    def __init__(self, initial=2, maximum=16, clock=time.time):
+        """
+        :param maximum: highest level, the pool needs as many threads
+        """
+        self.level = min(initial, maximum)
+        self.maximum = maximum
+        self.running = 0
+        self._clock = clock
+        self._round_start = None
+        self._round_done = 0
+        self._last_rate = None
+        self._last_decrease = None
+        self._start_times = {}
+
+    def can_start(self, item):
+        return self.running < self.level
+
+    def get_cost(self, item):
+        return 0
+
+    def started(self, item):
+        self.running += 1
+        now = self._clock()
+        self._start_times[id(item)] = now
+        if self._round_start is None:
+            self._round_start = now
+
+    def finished(self, item, error):
+        self.running -= 1
+        start_time = self._start_times.pop(id(item), None)
+        if error is not None:
+            if self._last_decrease is None or start_time >= self._last_decrease:
+                self.level = max(1, self.level // 2)
+                self._last_decrease = self._clock()
+            self._round_start = self._clock()
+            self._round_done = 0
+            self._last_rate = None
+            return
+        self._round_done += 1
+        if self._round_done < self.level:
+            return
+        now = self._clock()
+        rate = self._round_done / max(now - self._round_start, 1e-6)
+        if self._last_rate is None or rate >= self._last_rate:
+            self.level = min(self.level + 1, self.maximum)
+        self._last_rate = rate
+        self._round_start = now
+        self._round_done = 0
+
+
+def get_cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def parse_jobs(value, auto_value=AUTO_JOBS, default=1):
+    """
+    :param value: argument of a -j option, a number or 'auto', None
+      if the option was not given
+    :param auto_value: returned for 'auto'
+    :param default: returned for None
+    :returns: positive int, or auto_value
+    :raises MultiProjectException: for other values
+    """
+    if value is None:
+        return default
+    if str(value).strip().lower() == AUTO_JOBS:
+        return auto_value
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise MultiProjectException(
+            "Invalid number of parallel jobs, need a positive number or '%s': %s" %
+            (AUTO_JOBS, value))
+    return jobs
+
+
+def _run_job(func, item):
+    try:
+        return (item, func(item), None)
+    except (MultiProjectException, VcsError, EnvironmentError) as exc:
+        return (item, None, exc)
+    except Exception as exc:
+        # this would be a bug, and we need trace to find them in
+        # multithreaded cases.
+        traceback.print_exc(file=sys.stderr)
+        return (item, None, exc)
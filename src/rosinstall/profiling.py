@@ -0,0 +1,277 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Timing of rosinstall runs: wall and CPU time per phase (config merge,
+install, setup generation, bootstrap) and per installed entry, written
+as JSON with a fixed schema, so that profiles of many machines can be
+aggregated.
+
+Times are in seconds, start times relative to the start of the run.
+Phase CPU time is that of the whole process including waited-for child
+processes such as SCM calls. Entry CPU time is that of the installing
+thread only, null where the Python version cannot measure it, as SCM
+subprocesses of parallel entries cannot be told apart.
+
+The same data can be written as Chrome trace, to see how well parallel
+entries overlap and which of them are on the critical path.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from rosinstall.reference_cache import normalize_uri
+from rosinstall.simple_checkout import _get_dir_size
+
+PROFILE_FORMAT = 'rosinstall-profile'
+PROFILE_VERSION = 1
+
+# where SCMs keep the history fetched from remote
+_SCM_META_DIRS = {'git': '.git', 'hg': '.hg', 'bzr': '.bzr', 'svn': '.svn'}
+
+
+def _get_process_cpu():
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def _get_thread_cpu():
+    if hasattr(time, 'thread_time'):
+        return time.thread_time()
+    return None
+
+
+def get_uri_host(uri):
+    """
+    :returns: lowercase host name of uri, None for local paths
+    """
+    if not uri:
+        return None
+    normalized = normalize_uri(uri)
+    if '://' not in normalized:
+        return None
+    host = normalized.split('://', 1)[1].split('/', 1)[0]
+    if host.startswith('[') and ']' in host:
+        # IPv6 literal
+        return host[:host.index(']') + 1]
+    return host.split(':', 1)[0] or None
+
+
+def _get_meta_size(path, scmtype):
+    meta_dir = _SCM_META_DIRS.get(scmtype)
+    if meta_dir is None:
+        return None
+    meta_path = os.path.join(path, meta_dir)
+    if not os.path.isdir(meta_path):
+        return 0
+    return _get_dir_size(meta_path)
+
+
+class RunProfile(object):
+    """
+    Collects phase and entry timings of one run, thread-safe. Written
+    as profile by write() or as Chrome trace by write_trace().
+    """
+
+    def __init__(self, command, jobs=1):
+        self.command = command
+        self.jobs = jobs
+        # level chosen by -j auto
+        self.settled_jobs = None
+        self.phases = []
+        self.entries = []
+        self._lock = threading.Lock()
+        self._open_phases = {}
+        self._start_time = time.time()
+        self._start_cpu = _get_process_cpu()
+
+    def _now(self):
+        return time.time() - self._start_time
+
+    def begin_phase(self, name, track=None):
+        """
+        Starts phase name, for phases that do not fit a with block,
+        such as a background bootstrap.
+
+        :param track: name of the trace track, defaults to the current
+          thread, to be given for work done by background processes
+        """
+        with self._lock:
+            self._open_phases[name] = (self._now(), _get_process_cpu(),
+                                       track or threading.current_thread().name)
+
+    def end_phase(self, name, success=True):
+        with self._lock:
+            if name not in self._open_phases:
+                return
+            start, cpu, thread = self._open_phases.pop(name)
+            self.phases.append({'name': name,
+                                'thread': thread,
+                                'start': start,
+                                'wall': self._now() - start,
+                                'cpu': _get_process_cpu() - cpu,
+                                'success': success})
+
+    @contextmanager
+    def phase(self, name):
+        self.begin_phase(name)
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            self.end_phase(name, success)
+
+    @contextmanager
+    def entry(self, element, action):
+        """
+        Times the install of a config element.
+
+        :param action: 'checkout', 'update' or 'install' for non-vcs
+          elements
+        """
+        spec = element.get_path_spec()
+        scmtype = spec.get_scmtype()
+        path = element.get_path()
+        size_before = _get_meta_size(path, scmtype)
+        record = {'localname': element.get_local_name(),
+                  'action': action,
+                  'scmtype': scmtype,
+                  'host': get_uri_host(spec.get_uri()),
+                  'thread': threading.current_thread().name,
+                  'start': self._now(),
+                  'bytes': None,
+                  'success': False}
+        cpu = _get_thread_cpu()
+        try:
+            yield
+            record['success'] = True
+        finally:
+            record['wall'] = self._now() - record['start']
+            record['cpu'] = None if cpu is None else _get_thread_cpu() - cpu
+            size_after = _get_meta_size(path, scmtype)
+            if size_before is not None and size_after is not None:
+                # history fetched from remote, close to bytes transferred
+                record['bytes'] = max(0, size_after - size_before)
+            with self._lock:
+                self.entries.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            return {'format': PROFILE_FORMAT,
+                    'version': PROFILE_VERSION,
+                    'command': self.command,
+                    'jobs': self.jobs,
+                    'settled_jobs': self.settled_jobs,
+                    'started': self._start_time,
+                    'wall': self._now(),
+                    'cpu': _get_process_cpu() - self._start_cpu,
+                    'phases': sorted(self.phases, key=lambda phase: phase['start']),
+                    'entries': sorted(self.entries, key=lambda entry: entry['start'])}
+
+    def write(self, path):
+        with open(path, 'w') as fhand:
+            json.dump(self.to_dict(), fhand, indent=2, sort_keys=True)
+            fhand.write('\n')
+
+    def to_trace(self):
+        """
+        :returns: dict in the Chrome trace event format, with a track per
+          thread and a complete event per phase and entry
+        """
+        data = self.to_dict()
+        events = []
+        track_ids = {}
+
+        def get_track_id(track):
+            if track not in track_ids:
+                track_ids[track] = len(track_ids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                               'tid': track_ids[track], 'args': {'name': track}})
+            return track_ids[track]
+
+        def add_span(name, category, record, args):
+            events.append({'name': name,
+                           'cat': category,
+                           'ph': 'X',
+                           'pid': 1,
+                           'tid': get_track_id(record['thread']),
+                           'ts': int(record['start'] * 1e6),
+                           'dur': int(record['wall'] * 1e6),
+                           'args': args})
+
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': 1,
+                       'args': {'name': data['command']}})
+        for phase in data['phases']:
+            add_span(phase['name'], 'phase', phase,
+                     {'cpu': phase['cpu'], 'success': phase['success']})
+        for entry in data['entries']:
+            add_span(entry['localname'], entry['action'], entry,
+                     dict([(key, entry[key]) for key in
+                           ['scmtype', 'host', 'bytes', 'cpu', 'success']]))
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path):
+        """
+        Writes to_trace() as JSON, loadable in chrome://tracing or Perfetto
+        """
+        with open(path, 'w') as fhand:
+            json.dump(self.to_trace(), fhand)
+            fhand.write('\n')
+
+
+@contextmanager
+def timed_phase(profile, name):
+    """
+    profile.phase(name), or nothing if profile is None
+    """
+    if profile is None:
+        yield
+    else:
+        with profile.phase(name):
+            yield
+
+
+@contextmanager
+def timed_entry(profile, element, action):
+    """
+    profile.entry(element, action), or nothing if profile is None
+    """
+    if profile is None:
+        yield
+    else:
+        with profile.entry(element, action):
+            yield
@@ -0,0 +1,222 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Machine-wide cache of bare git mirrors, shared by all workspaces and
+by concurrent rosinstall processes. Checkouts are cloned from the
+mirror, which only fetches what it lacks from upstream.
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+from rosinstall.simple_checkout import _run_git, _get_dir_size
+
+CACHE_DIR_ENV = 'ROSINSTALL_CACHE_DIR'
+CACHE_SIZE_ENV = 'ROSINSTALL_CACHE_SIZE'
+# MiB
+DEFAULT_CACHE_SIZE = 10240
+
+
+def normalize_uri(uri):
+    """
+    :returns: uri without user, trailing slashes and '.git' suffix and
+      with lowercase scheme and host, so that e.g.
+      https://user@github.com/ros/ros.git/ and https://github.com/ros/ros
+      share one mirror
+    """
+    uri = uri.strip()
+    match = re.match(r'^([A-Za-z][A-Za-z0-9+.-]*)://(?:[^@/]*@)?([^/]*)(.*)$', uri)
+    if match:
+        scheme, host, path = match.groups()
+        uri = '%s://%s%s' % (scheme.lower(), host.lower(), path)
+    else:
+        # scp-like syntax user@host:path
+        match = re.match(r'^(?:[^@/]*@)?([^:/]+):(.*)$', uri)
+        if match:
+            uri = 'ssh://%s/%s' % (match.group(1).lower(), match.group(2).lstrip('/'))
+    uri = uri.rstrip('/')
+    if uri.endswith('.git'):
+        uri = uri[:-len('.git')]
+    return uri
+
+
+class ReferenceCache(object):
+    """
+    Directory of bare git mirrors keyed by normalized URI. Each mirror
+    has a lock file: creating or fetching a mirror takes it
+    exclusively, cloning from it takes it shared, so parallel jobs and
+    processes never see a half-written mirror.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :param path: cache directory, created if missing
+        :param max_size: in MiB, least recently used mirrors are
+          removed by prune() above that
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fetched = set()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def get_mirror_path(self, uri):
+        normalized = normalize_uri(uri)
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', normalized.split('://')[-1])[-60:]
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.path, '%s-%s.git' % (name.strip('_'), digest))
+
+    @contextmanager
+    def _locked(self, mirror_path, exclusive):
+        with open(mirror_path + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def update_mirror(self, uri):
+        """
+        Creates the mirror of uri or fetches into it, at most once per
+        instance.
+
+        :returns: True if the mirror is usable
+        """
+        mirror_path = self.get_mirror_path(uri)
+        normalized = normalize_uri(uri)
+        with self._locked(mirror_path, exclusive=True):
+            with self._lock:
+                if normalized in self._fetched:
+                    return os.path.isdir(mirror_path)
+            if os.path.isdir(mirror_path):
+                success = _run_git(['fetch', '-q', '--prune', uri,
+                                    '+refs/heads/*:refs/heads/*',
+                                    '+refs/tags/*:refs/tags/*'],
+                                   cwd=mirror_path)
+            else:
+                # clone next to the mirror, killed runs leave no partial mirror
+                tmp_path = '%s.tmp%s' % (mirror_path, os.getpid())
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+                success = _run_git(['clone', '-q', '--mirror', uri, tmp_path])
+                if success:
+                    os.rename(tmp_path, mirror_path)
+                elif os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+            with self._lock:
+                self._fetched.add(normalized)
+            return success
+
+    def clone(self, uri, path, version):
+        """
+        Clones from the mirror of uri into path, with origin set to
+        uri, and checks out version.
+
+        :returns: True on success, False if no checkout was made
+        """
+        mirror_path = self.get_mirror_path(uri)
+        if not self.update_mirror(uri) and not os.path.isdir(mirror_path):
+            return False
+        with self._locked(mirror_path, exclusive=False):
+            if not os.path.isdir(mirror_path):
+                # pruned meanwhile
+                return False
+            # local clones hardlink objects, the workspace does not
+            # depend on the cache once done
+            success = (_run_git(['clone', '-q', '--no-checkout', mirror_path, path]) and
+                       _run_git(['remote', 'set-url', 'origin', uri], cwd=path) and
+                       _run_git(['checkout', '-q'] + ([version] if version else []),
+                                cwd=path) and
+                       _run_git(['submodule', 'update', '--init', '--recursive'],
+                                cwd=path))
+            try:
+                # the mtime marks the last use for pruning
+                os.utime(mirror_path, None)
+            except OSError:
+                pass
+        if not success and os.path.exists(path):
+            shutil.rmtree(path)
+        return success
+
+    def prune(self):
+        """
+        Removes least recently used mirrors until the cache is below
+        max_size. Mirrors in use by other processes are skipped.
+
+        :returns: list of removed mirror paths
+        """
+        mirrors = []
+        for name in os.listdir(self.path):
+            mirror_path = os.path.join(self.path, name)
+            if name.endswith('.git') and os.path.isdir(mirror_path):
+                mirrors.append((os.path.getmtime(mirror_path),
+                                _get_dir_size(mirror_path),
+                                mirror_path))
+        total = sum([size for _, size, _ in mirrors])
+        limit = self.max_size * 1024 * 1024
+        removed = []
+        for _, size, mirror_path in sorted(mirrors):
+            if total <= limit:
+                break
+            with open(mirror_path + '.lock', 'a') as lockfile:
+                try:
+                    fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    continue
+                try:
+                    shutil.rmtree(mirror_path)
+                finally:
+                    fcntl.flock(lockfile, fcntl.LOCK_UN)
+            total -= size
+            removed.append(mirror_path)
+        return removed
+
+
+def get_reference_cache(path=None, max_size=None):
+    """
+    :param path: cache directory, defaults to $ROSINSTALL_CACHE_DIR
+    :param max_size: in MiB, defaults to $ROSINSTALL_CACHE_SIZE or 10 GiB
+    :returns: ReferenceCache, or None if no cache directory is configured
+    """
+    path = path or os.environ.get(CACHE_DIR_ENV)
+    if not path:
+        return None
+    if max_size is None:
+        max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+    return ReferenceCache(path, max_size=int(max_size))
@@ -0,0 +1,232 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Remote rosinstall sources given by URL are downloaded concurrently
+before the config is built, instead of one after another while
+merging. Downloads are cached with their ETag and Last-Modified
+headers and revalidated on later runs, so an unchanged source costs a
+304 response only.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import yaml
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+from vcstools.common import urlopen_netrc
+from wstool.common import MultiProjectException
+from wstool import multiproject_cmd
+
+from rosinstall.parallel import WorkerPool
+
+# remote sources are few and small, more threads only add load on the servers
+DEFAULT_FETCH_THREADS = 8
+SOURCE_CACHE_ENV = 'ROSINSTALL_SOURCE_CACHE'
+DEFAULT_SOURCE_CACHE = os.path.join('~', '.ros', 'rosinstall', 'sources')
+
+
+def is_remote_uri(uri):
+    """
+    :returns: True if uri is a URL rather than a local file or folder
+    """
+    return (not os.path.exists(uri) and
+            re.match(r'^(?:https?|ftp)://', uri) is not None)
+
+
+class SourceCache(object):
+    """
+    Directory of downloaded rosinstall sources keyed by URL, each with
+    a json file holding the validators sent back on revalidation.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def _get_paths(self, uri):
+        name = hashlib.sha1(uri.encode('utf-8')).hexdigest()
+        return (os.path.join(self.path, name + '.rosinstall'),
+                os.path.join(self.path, name + '.json'))
+
+    def load(self, uri):
+        """
+        :returns: (content, headers dict) of the cached copy, or None
+        """
+        content_path, headers_path = self._get_paths(uri)
+        try:
+            with open(headers_path, 'r') as fhand:
+                headers = json.load(fhand)
+            with open(content_path, 'rb') as fhand:
+                content = fhand.read()
+        except (IOError, ValueError):
+            return None
+        if headers.get('url') != uri:
+            return None
+        return content, headers
+
+    def store(self, uri, content, etag=None, last_modified=None):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        content_path, headers_path = self._get_paths(uri)
+        # renamed into place, concurrent runs never read partial files
+        for path, data in [(content_path, content),
+                           (headers_path, json.dumps({'url': uri,
+                                                      'etag': etag,
+                                                      'last_modified': last_modified}).encode('utf-8'))]:
+            tmp_path = '%s.tmp%s' % (path, os.getpid())
+            with open(tmp_path, 'wb') as fhand:
+                fhand.write(data)
+            os.rename(tmp_path, path)
+
+
+def get_source_cache():
+    """
+    :returns: SourceCache in $ROSINSTALL_SOURCE_CACHE or
+      ~/.ros/rosinstall/sources
+    """
+    return SourceCache(os.path.expanduser(
+        os.environ.get(SOURCE_CACHE_ENV, DEFAULT_SOURCE_CACHE)))
+
+
+def _open_url(uri, headers):
+    try:
+        return urlopen(Request(uri, headers=headers))
+    except HTTPError as exc:
+        if exc.code != 401:
+            raise
+    # netrc credentials, without revalidation
+    return urlopen_netrc(uri)
+
+
+def download_source(uri, cache=None, offline=False):
+    """
+    :param cache: SourceCache, revalidated and updated if given
+    :param offline: use the cached copy without contacting the server
+    :returns: content of the rosinstall source at uri, checked to be
+      yaml
+    :raises MultiProjectException: if the download fails or the
+      content is no yaml
+    """
+    cached = cache.load(uri) if cache is not None else None
+    if offline:
+        if cached is None:
+            raise MultiProjectException(
+                "No cached copy of [%s] to use offline" % uri)
+        return cached[0]
+    headers = {}
+    if cached is not None:
+        if cached[1].get('etag'):
+            headers['If-None-Match'] = cached[1]['etag']
+        if cached[1].get('last_modified'):
+            headers['If-Modified-Since'] = cached[1]['last_modified']
+    try:
+        stream = _open_url(uri, headers)
+        try:
+            content = stream.read()
+            info = stream.info()
+        finally:
+            stream.close()
+    except HTTPError as exc:
+        if exc.code == 304 and cached is not None:
+            return cached[0]
+        raise MultiProjectException("Unable to download URL [%s]: %s" % (uri, exc))
+    except (IOError, ValueError) as exc:
+        raise MultiProjectException("Unable to download URL [%s]: %s" % (uri, exc))
+    try:
+        yaml.safe_load(content)
+    except yaml.YAMLError as exc:
+        raise MultiProjectException(
+            "Invalid multiproject yaml format in [%s]: %s" % (uri, exc))
+    if cache is not None:
+        cache.store(uri, content,
+                    etag=info.get('ETag'),
+                    last_modified=info.get('Last-Modified'))
+    return content
+
+
+def fetch_remote_uris(uris, target_dir, num_threads=DEFAULT_FETCH_THREADS,
+                      cache=None, offline=False):
+    """
+    Downloads the remote uris concurrently into files in target_dir.
+
+    :param cache: SourceCache for conditional downloads
+    :param offline: only use cached copies
+    :returns: uris with remote ones replaced by their downloaded files,
+      in the original order
+    :raises MultiProjectException: if any download fails
+    """
+    remote_uris = [uri for uri in uris if is_remote_uri(uri)]
+    local_files = {}
+    pool = WorkerPool(min(num_threads, max(1, len(remote_uris))))
+    for index, (uri, content, error) in enumerate(pool.imap(
+            lambda uri: download_source(uri, cache, offline), remote_uris)):
+        if error is not None:
+            raise error
+        # not named like a workspace config, which wstool would rewrite
+        local_files[uri] = os.path.join(target_dir, '%d.rosinstall.yaml' % index)
+        with open(local_files[uri], 'wb') as fhand:
+            fhand.write(content)
+    return [local_files.get(uri, uri) for uri in uris]
+
+
+def get_config(basepath, additional_uris=None, config_filename=None,
+               num_threads=DEFAULT_FETCH_THREADS, cache=None, offline=False):
+    """
+    Same as wstool's get_config, but downloads remote additional_uris
+    concurrently first. They are merged in the given order, so later
+    uris still shadow earlier ones.
+
+    :param cache: SourceCache for conditional downloads
+    :param offline: only use cached copies of remote uris
+    """
+    if not additional_uris or not [uri for uri in additional_uris if is_remote_uri(uri)]:
+        return multiproject_cmd.get_config(basepath=basepath,
+                                           additional_uris=additional_uris,
+                                           config_filename=config_filename)
+    download_dir = tempfile.mkdtemp()
+    try:
+        return multiproject_cmd.get_config(
+            basepath=basepath,
+            additional_uris=fetch_remote_uris(additional_uris, download_dir, num_threads,
+                                              cache=cache, offline=offline),
+            config_filename=config_filename)
+    finally:
+        shutil.rmtree(download_dir)
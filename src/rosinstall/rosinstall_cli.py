@@ -50,10 +50,15 @@ from __future__ import print_function
 import os
 import sys
 from optparse import OptionParser
-import yaml
 import shutil
 
-from rosinstall import rosinstall_cmd
+from rosinstall import rosinstall_cmd, remote_config
+from rosinstall.reference_cache import get_reference_cache
+from rosinstall.uri_rewrite import load_rewrite_rules
+from rosinstall.host_limits import load_host_limits
+from rosinstall.install_options import add_install_options, get_install_mode
+from rosinstall.parallel import parse_jobs, get_cpu_count, AUTO_JOBS
+from rosinstall.profiling import RunProfile, timed_phase
 from wstool import multiproject_cmd
 from wstool.helpers import ROSINSTALL_FILENAME
 import rosinstall.__version__
@@ -127,10 +132,36 @@ Later URIs will shadow packages of earlier URIs.\n",
                       default=False,
                       help="shows a combined status command over all SCM entries, also showing untracked files",
                       action="store_true")
+    parser.add_option("--fetch-only", dest="fetch_only",
+                      default=False,
+                      help="Download remote changes of the SCM entries in parallel, without updating their working trees",
+                      action="store_true")
     parser.add_option("-j", "--parallel", dest="jobs",
-                      default=1,
-                      help="How many parallel threads to use for installing",
+                      default=None,
+                      help="How many parallel threads to use for installing or querying SCMs, 'auto' adapts it to the throughput when installing, defaults to 1 for installing, 'auto' for --fetch-only and the number of CPUs for querying",
                       action="store")
+    parser.add_option("--shallow", dest="shallow", default=False,
+                      help="Clone only the pinned version of each entry, without history",
+                      action="store_true")
+    parser.add_option("--partial", dest="partial", default=False,
+                      help="Clone git entries without file contents of other versions",
+                      action="store_true")
+    parser.add_option("--force-update", dest="force_update", default=False,
+                      help="Also update entries already at their pinned tag or commit id",
+                      action="store_true")
+    parser.add_option("--force-bootstrap", dest="force_bootstrap", default=False,
+                      help="Bootstrap the ROS build even if the core ros trees did not change since the last bootstrap",
+                      action="store_true")
+    parser.add_option("--pipeline", dest="pipeline", default=False,
+                      help="Check out the core ros stack first, and generate setup files and bootstrap the build while other entries are still being checked out, requires --rosdep-yes",
+                      action="store_true")
+    parser.add_option("--resume", dest="resume", default=False,
+                      help="Skip entries completed by an interrupted run in this workspace",
+                      action="store_true")
+    parser.add_option("--offline", dest="offline", default=False,
+                      help="Use cached copies of rosinstall sources given by URL instead of downloading them",
+                      action="store_true")
+    add_install_options(parser)
     parser.add_option(
         "--generate-versioned-rosinstall", dest="generate_versioned",
         default=None,
@@ -144,100 +175,163 @@ Later URIs will shadow packages of earlier URIs.\n",
     if len(args) < 1:
         parser.error("rosinstall requires at least 1 argument")
 
-    mode = 'prompt'
-    if options.delete_changed:
-        mode = 'delete'
-    if options.abort_changed:
-        if mode == 'delete':
-            parser.error(
-                "delete-changed-uris is mutually exclusive with abort-changed-uris")
-        mode = 'abort'
-    if options.backup_changed != '':
-        if mode == 'delete':
-            parser.error(
-                "delete-changed-uris is mutually exclusive with backup-changed-uris")
-        if mode == 'abort':
-            parser.error(
-                "abort-changed-uris is mutually exclusive with backup-changed-uris")
-        mode = 'backup'
+    mode = get_install_mode(parser, options)
 
     # Catkin must be enabled if catkinpp is set
     if options.catkinpp:
         options.catkin = True
 
-    # Get the path to the rosinstall
-    options.path = os.path.abspath(args[0])
+    profile = None
+    if options.profile or options.trace:
+        profile = RunProfile('rosinstall', jobs=parse_jobs(options.jobs))
+    try:
+        # Get the path to the rosinstall
+        options.path = os.path.abspath(args[0])
 
-    config_uris = args[1:]
+        config_uris = args[1:]
 
-    config = multiproject_cmd.get_config(basepath=options.path,
-                                         additional_uris=config_uris,
-                                         config_filename=ROSINSTALL_FILENAME)
+        with timed_phase(profile, 'config'):
+            config = remote_config.get_config(basepath=options.path,
+                                              additional_uris=config_uris,
+                                              config_filename=ROSINSTALL_FILENAME,
+                                              cache=remote_config.get_source_cache(),
+                                              offline=options.offline)
 
-    if options.generate_versioned:
-        filename = os.path.abspath(options.generate_versioned)
-        source_aggregate = multiproject_cmd.cmd_snapshot(config)
-        with open(filename, 'w') as fhand:
-            fhand.write(yaml.safe_dump(source_aggregate))
-        print("Saved versioned rosinstall of current directory %s to %s" %
-              (options.path, filename))
-        return True
+        if options.generate_versioned:
+            filename = os.path.abspath(options.generate_versioned)
+            # a failing SCM query must not leave a truncated file
+            tmp_filename = filename + '.tmp'
+            try:
+                with open(tmp_filename, 'w') as fhand:
+                    rosinstall_cmd.write_snapshot(
+                        rosinstall_cmd.cmd_snapshot(
+                            config, num_threads=parse_jobs(options.jobs, get_cpu_count(), default=get_cpu_count())),
+                        fhand)
+                os.rename(tmp_filename, filename)
+            finally:
+                if os.path.exists(tmp_filename):
+                    os.remove(tmp_filename)
+            print("Saved versioned rosinstall of current directory %s to %s" %
+                  (options.path, filename))
+            return True
 
-    if options.vcs_diff:
-        difflist = multiproject_cmd.cmd_diff(config)
-        alldiff = []
-        for entrydiff in difflist:
-            if entrydiff['diff'] is not None and entrydiff['diff'] != '':
-                alldiff.append(entrydiff['diff'])
-        print('\n'.join(alldiff))
-        return True
+        if options.vcs_diff:
+            # diffs are separated by newlines, as if joined
+            separator = ''
+            for diff in rosinstall_cmd.cmd_diff(
+                    config, num_threads=parse_jobs(options.jobs, get_cpu_count(), default=get_cpu_count())):
+                if diff is not None and diff != '':
+                    sys.stdout.write(separator + diff)
+                    sys.stdout.flush()
+                    separator = '\n'
+            print()
+            return True
 
-    if options.vcs_status or options.vcs_status_untracked:
-        statuslist = multiproject_cmd.cmd_status(
-          config,
-          untracked=options.vcs_status_untracked)
-        allstatus = ""
-        for entrystatus in statuslist:
-            if entrystatus['status'] is not None:
-                allstatus += entrystatus['status']
-        print(allstatus, end='')
-        return True
+        if options.vcs_status or options.vcs_status_untracked:
+            for status in rosinstall_cmd.cmd_status(
+                    config,
+                    untracked=options.vcs_status_untracked,
+                    num_threads=parse_jobs(options.jobs, get_cpu_count(), default=get_cpu_count())):
+                if status is not None:
+                    sys.stdout.write(status)
+                    sys.stdout.flush()
+            return True
+
+        if options.fetch_only:
+            with timed_phase(profile, 'fetch'):
+                rosinstall_cmd.cmd_fetch(
+                    config,
+                    robust=options.robust,
+                    num_threads=parse_jobs(options.jobs, default=AUTO_JOBS),
+                    cache=get_reference_cache(options.cache_dir),
+                    rewriter=load_rewrite_rules(),
+                    profile=profile,
+                    jobs_per_host=options.jobs_per_host,
+                    host_limits=load_host_limits(),
+                    inactivity_timeout=options.inactivity_timeout,
+                    entry_timeout=options.entry_timeout,
+                    retries=options.retries)
+            return True
+
+        print("rosinstall operating on", options.path,
+              "from specifications in rosinstall files ",
+              ", ".join(config_uris))
+
+        # includes ROS specific files
+        print("(Over-)Writing %s" %
+              os.path.join(options.path, ROSINSTALL_FILENAME))
+        if(os.path.isfile(os.path.join(options.path, ROSINSTALL_FILENAME))):
+            shutil.move(os.path.join(options.path, ROSINSTALL_FILENAME),
+                        "%s.bak" % os.path.join(options.path, ROSINSTALL_FILENAME))
+        rosinstall_cmd.cmd_persist_config(config)
+
+        # in pipeline mode, bootstrap as soon as its elements are there
+        bootstrap = []
+        priority_localnames = None
+        if options.pipeline and not options.catkin and not options.nobuild:
+            if options.rosdep_yes:
+                priority_localnames = rosinstall_cmd.get_bootstrap_localnames(config)
+            else:
+                print("--pipeline requires --rosdep-yes, as rosdep cannot ask in the background, bootstrapping after the install")
+
+        def start_bootstrap():
+            bootstrap.append(rosinstall_cmd.cmd_start_ros_bootstrap(
+                config, options.path, options.rosdep_yes,
+                force=options.force_bootstrap, profile=profile))
 
-    print("rosinstall operating on", options.path,
-          "from specifications in rosinstall files ",
-          ", ".join(config_uris))
-
-    # includes ROS specific files
-    print("(Over-)Writing %s" %
-          os.path.join(options.path, ROSINSTALL_FILENAME))
-    if(os.path.isfile(os.path.join(options.path, ROSINSTALL_FILENAME))):
-        shutil.move(os.path.join(options.path, ROSINSTALL_FILENAME),
-                    "%s.bak" % os.path.join(options.path, ROSINSTALL_FILENAME))
-    rosinstall_cmd.cmd_persist_config(config)
-
-    ## install or update each element
-    install_success = multiproject_cmd.cmd_install_or_update(
-        config,
-        backup_path=options.backup_changed,
-        mode=mode,
-        robust=options.robust,
-        num_threads=int(options.jobs),
-        verbose=options.verbose)
-
-    rosinstall_cmd.cmd_generate_ros_files(
-        config,
-        options.path,
-        options.nobuild,
-        options.rosdep_yes,
-        options.catkin,
-        options.catkinpp)
-
-    if not install_success:
-        print("Warning: installation encountered errors, but --continue-on-error was requested.    Look above for warnings.")
-
-    print("\nrosinstall update complete.")
-    if (options.catkin is False
-        and options.catkinpp is None):
-
-        print("\n\nNow, type 'source %s/setup.bash' to set up your environment.\nAdd that to the bottom of your ~/.bashrc to set it up every time.\n\nIf you are not using bash please see http://www.ros.org/wiki/rosinstall/NonBashShells " % os.path.abspath(options.path))
-    return True
+        ## install or update each element
+        try:
+            with timed_phase(profile, 'install'):
+                install_success = rosinstall_cmd.cmd_install_or_update(
+                    config,
+                    backup_path=options.backup_changed,
+                    mode=mode,
+                    robust=options.robust,
+                    num_threads=parse_jobs(options.jobs),
+                    verbose=options.verbose,
+                    shallow=options.shallow,
+                    partial=options.partial,
+                    cache=get_reference_cache(options.cache_dir),
+                    rewriter=load_rewrite_rules(),
+                    archive=options.archive,
+                    force_update=options.force_update,
+                    resume=options.resume,
+                    priority_localnames=priority_localnames,
+                    on_priority_done=start_bootstrap,
+                    profile=profile,
+                    jobs_per_host=options.jobs_per_host,
+                    host_limits=load_host_limits(),
+                    inactivity_timeout=options.inactivity_timeout,
+                    entry_timeout=options.entry_timeout,
+                    retries=options.retries)
+        except:
+            # do not leave the bootstrap running
+            if bootstrap and bootstrap[0] is not None:
+                bootstrap[0][0].terminate()
+            raise
+
+        rosinstall_cmd.cmd_generate_ros_files(
+            config,
+            options.path,
+            options.nobuild,
+            options.rosdep_yes,
+            options.catkin,
+            options.catkinpp,
+            bootstrap=bootstrap[0] if bootstrap else None,
+            force_bootstrap=options.force_bootstrap,
+            profile=profile)
+
+        if not install_success:
+            print("Warning: installation encountered errors, but --continue-on-error was requested.    Look above for warnings.")
+
+        print("\nrosinstall update complete.")
+        if (options.catkin is False
+            and options.catkinpp is None):
+
+            print("\n\nNow, type 'source %s/setup.bash' to set up your environment.\nAdd that to the bottom of your ~/.bashrc to set it up every time.\n\nIf you are not using bash please see http://www.ros.org/wiki/rosinstall/NonBashShells " % os.path.abspath(options.path))
+        return True
+    finally:
+        if options.profile:
+            profile.write(options.profile)
+        if options.trace:
+            profile.write_trace(options.trace)
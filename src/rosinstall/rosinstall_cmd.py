@@ -31,12 +31,30 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+from __future__ import print_function
+import hashlib
 import os
+import shutil
 import subprocess
+import sys
+import time
+import vcstools
+import yaml
 from wstool.multiproject_cmd import cmd_persist_config as multipersist
+from wstool.common import MultiProjectException, select_elements, normabspath
 from rosinstall import setupfiles
 from wstool.helpers import ROSINSTALL_FILENAME
 from rosinstall.helpers import is_path_ros
+from wstool.config_elements import SetupConfigElement
+from rosinstall.parallel import WorkerPool, AdaptiveLimiter, AUTO_JOBS
+from rosinstall.simple_checkout import CheckoutSession, is_at_pinned_version
+from rosinstall.archive import get_archive_url, get_archive_checkout
+from rosinstall.journal import InstallJournal, is_completed, reverify_in_flight
+from rosinstall.profiling import timed_entry, timed_phase
+from rosinstall.host_limits import get_host_limiter
+from rosinstall.durations import DurationHistory
+from rosinstall.watchdog import DEFAULT_RETRIES, run_with_timeouts
+from wstool.config_yaml import PathSpec
 
 
 def cmd_persist_config(config, config_filename=ROSINSTALL_FILENAME, header=''):
@@ -51,6 +69,670 @@ def cmd_persist_config(config, config_filename=ROSINSTALL_FILENAME, header=''):
     multipersist(config, config_filename, header)
 
 
+def _use_archive_element(config, element):
+    """
+    If a git element was checked out as source archive of its pinned
+    version, replaces it in config by the tar element describing that
+    checkout.
+
+    :returns: the element to install
+    """
+    if not element.is_vcs_element():
+        return element
+    path_spec = element.get_path_spec()
+    if path_spec.get_scmtype() != 'git':
+        return element
+    checkout = get_archive_checkout(element.get_path())
+    if (checkout is None or
+            checkout[0] != get_archive_url(path_spec.get_uri(), path_spec.get_version())):
+        return element
+    config.add_path_spec(PathSpec(path_spec.get_local_name(),
+                                  scmtype='tar',
+                                  uri=checkout[0],
+                                  version=checkout[1],
+                                  tags=path_spec.get_tags()),
+                         merge_strategy='MergeReplace')
+    for tar_element in config.get_config_elements():
+        if tar_element.get_path() == element.get_path():
+            return tar_element
+    return element
+
+
+def _prepare_install(config, backup_path, mode, robust, localnames):
+    """
+    Checks the filesystem for each element and asks the user how to
+    proceed where it differs from the config, via the elements'
+    prepare_install.
+
+    :returns: (list of PreparationReports of elements to install,
+      False if preparing some element failed and robust)
+    :raises MultiProjectException: if the user aborts, or preparing
+      some element failed and not robust
+    """
+    success = True
+    reports = []
+    abs_backup_path = None
+    if backup_path is not None:
+        abs_backup_path = os.path.join(config.get_base_path(), backup_path)
+    for element in select_elements(config, localnames):
+        try:
+            report = element.prepare_install(backup_path=abs_backup_path,
+                                             arg_mode=mode,
+                                             robust=robust)
+        except MultiProjectException as exc:
+            fail_str = "Failed to install tree '%s'\n %s" % (element.get_path(), exc)
+            if not robust:
+                raise MultiProjectException(fail_str)
+            success = False
+            print("Continuing despite %s" % fail_str)
+            continue
+        if report is None:
+            continue
+        if report.abort:
+            raise MultiProjectException("Aborting install because of %s" % report.error)
+        if not report.skip:
+            reports.append(report)
+        elif report.error is not None:
+            print("Skipping install of %s because: %s" %
+                  (element.get_local_name(), report.error))
+    return reports, success
+
+
+def _get_action(report):
+    """
+    :returns: 'checkout', 'update' or 'install' for non-vcs elements
+    """
+    if not report.config_element.is_vcs_element():
+        return 'install'
+    return 'checkout' if report.checkout else 'update'
+
+
+def _get_estimate(report, history):
+    action = _get_action(report)
+    if action == 'install':
+        return 0.0
+    element = report.config_element
+    return history.get_estimate(element.get_local_name(),
+                                element.get_path_spec().get_uri(),
+                                action)
+
+
+def _install_journaled(report, journal, **kwargs):
+    """
+    _install_element, recording begin and outcome in the journal.
+    Fresh checkouts record their begin once the path is cleared.
+    """
+    element = report.config_element
+    if not (report.checkout and element.is_vcs_element()):
+        journal.begin(element)
+    try:
+        result = _install_element(report, journal=journal, **kwargs)
+    except Exception:
+        journal.failed(element)
+        raise
+    journal.done(element)
+    return result
+
+
+def _install_element(report, session, timeout=None, verbose=False,
+                     force_update=False, journal=None):
+    """
+    Checkout or update a single element, VCS checkouts and updates are
+    done via the session. Updates of elements already at their pinned
+    version are skipped unless force_update.
+    """
+    element = report.config_element
+    if not element.is_vcs_element():
+        element.install(checkout=report.checkout,
+                        backup=report.backup,
+                        backup_path=report.backup_path,
+                        inplace=report.inplace,
+                        timeout=timeout,
+                        verbose=verbose)
+        return {}
+    path_spec = element.get_path_spec()
+    path = element.get_path()
+    rewrite = session.describe_rewrite(path_spec.get_uri())
+    if verbose and rewrite:
+        print("[%s] %s" % (element.get_local_name(), rewrite))
+    if (not report.checkout and not force_update and
+            is_at_pinned_version(path_spec.get_scmtype(), path, path_spec.get_version())):
+        print("[%s] Already at pinned version %s" % (element.get_local_name(),
+                                                       path_spec.get_version()))
+        return {}
+    if not report.checkout:
+        print("[%s] Updating %s" % (element.get_local_name(), path))
+        if not session.update(path_spec.get_scmtype(),
+                              path,
+                              path_spec.get_version(),
+                              verbose=verbose,
+                              timeout=timeout,
+                              uri=path_spec.get_uri()):
+            raise MultiProjectException(
+                "[%s] Update Failed of %s" % (element.get_local_name(), path))
+        print("[%s] Done." % element.get_local_name())
+        return {}
+    print("[%s] Fetching %s (version %s) to %s" % (
+        element.get_local_name(), path_spec.get_uri(),
+        path_spec.get_version(), path))
+    if element.path_exists():
+        if os.path.islink(path):
+            if report.inplace is False:
+                # remove same as unlink
+                os.remove(path)
+            else:
+                shutil.rmtree(os.path.realpath(path))
+        else:
+            if report.backup is False:
+                shutil.rmtree(path)
+            else:
+                element.backup(report.backup_path)
+    if journal is not None:
+        journal.begin(element, checkout=True)
+    if not session.checkout(path_spec.get_scmtype(),
+                            path,
+                            path_spec.get_uri(),
+                            path_spec.get_version(),
+                            verbose=verbose,
+                            timeout=timeout,
+                            tags=path_spec.get_tags()):
+        raise MultiProjectException(
+            "[%s] Checkout of %s version %s into %s failed." % (
+                element.get_local_name(),
+                path_spec.get_uri(),
+                path_spec.get_version(),
+                path))
+    print("[%s] Done." % element.get_local_name())
+    return {}
+
+
+def _get_pool(items, num_threads, jobs_per_host, host_limits, rewriter):
+    """
+    :param items: install reports or config elements to process
+    :returns: (WorkerPool limiting jobs per host, AdaptiveLimiter or
+      None) for num_threads or AUTO_JOBS
+    """
+    limiters = []
+    host_limiter = get_host_limiter(items, jobs_per_host, host_limits, rewriter)
+    if host_limiter is not None:
+        limiters.append(host_limiter)
+    adaptive = None
+    if num_threads == AUTO_JOBS:
+        adaptive = AdaptiveLimiter()
+        limiters.append(adaptive)
+        num_threads = adaptive.maximum
+    return WorkerPool(num_threads, limiters=limiters), adaptive
+
+
+def _print_settled_jobs(adaptive, profile):
+    print("Adaptive parallelism settled at %d jobs, pass -j %d to reuse it" %
+          (adaptive.level, adaptive.level))
+    if profile is not None:
+        profile.settled_jobs = adaptive.level
+
+
+def cmd_install_or_update(
+        config,
+        backup_path=None,
+        mode='abort',
+        robust=False,
+        localnames=None,
+        num_threads=1,
+        timeout=None,
+        verbose=False,
+        shallow=False,
+        partial=False,
+        cache=None,
+        rewriter=None,
+        archive=False,
+        force_update=False,
+        resume=False,
+        priority_localnames=None,
+        on_priority_done=None,
+        profile=None,
+        jobs_per_host=None,
+        host_limits=None,
+        inactivity_timeout=None,
+        entry_timeout=None,
+        retries=DEFAULT_RETRIES):
+    """
+    Replaces wstool's cmd_install_or_update for rosinstall and rosws:
+    makes the local filesystem look like what the config specifies.
+    Entries sharing a repository are only fetched once, see
+    simple_checkout.CheckoutSession.
+
+    :param backup_path: if and where to backup trees before deleting them
+    :param robust: proceed to next element even when one element fails
+    :param num_threads: how many elements to install in parallel, or
+      AUTO_JOBS to adapt it to the throughput
+    :param shallow: clone only the pinned versions, without history
+    :param partial: clone git repositories without blobs
+    :param cache: reference_cache.ReferenceCache to clone git entries from
+    :param rewriter: uri_rewrite.UriRewriter for fetching from mirrors
+    :param archive: download source archives of pinned git elements
+      where possible, these are recorded as tar elements in the config
+    :param force_update: also update elements already at their pinned
+      tag or commit id
+    :param resume: skip elements completed by an interrupted run,
+      according to the journal in the workspace
+    :param priority_localnames: elements to install before all others
+    :param on_priority_done: called once all priority elements were
+      installed successfully, while the others are still installing
+    :param profile: RunProfile timing each element
+    :param jobs_per_host: limit of parallel jobs per host of the uris,
+      for hosts not in host_limits
+    :param host_limits: dict of host to limit of parallel jobs
+    :param inactivity_timeout: see watchdog.run_with_timeouts
+    :param entry_timeout: total_timeout of watchdog.run_with_timeouts
+    :param retries: see watchdog.run_with_timeouts
+    :returns: True on Success
+    :raises MultiProjectException: on plenty of errors
+    """
+    if not os.path.exists(config.get_base_path()):
+        os.mkdir(config.get_base_path())
+    # archive checkouts of earlier runs
+    converted = False
+    if archive:
+        for element in select_elements(config, localnames):
+            converted = _use_archive_element(config, element) is not element or converted
+    journal = InstallJournal(config.get_base_path())
+    interrupted = journal.read_interrupted() if resume else None
+    if resume and interrupted is None:
+        print("No interrupted run to resume in %s" % config.get_base_path())
+    if interrupted is not None:
+        completed, in_flight = interrupted
+        remaining = []
+        for element in select_elements(config, localnames):
+            name = element.get_local_name()
+            if is_completed(element, completed.get(name)):
+                print("[%s] Completed by the interrupted run, skipping" % name)
+                continue
+            if name in in_flight and reverify_in_flight(element, in_flight[name]):
+                print("[%s] Removed incomplete checkout of the interrupted run" % name)
+            remaining.append(name)
+        localnames = remaining
+    journal.start(resume=interrupted is not None)
+    history = DurationHistory(config.get_base_path())
+    session = CheckoutSession(shallow=shallow, partial=partial, cache=cache,
+                              rewriter=rewriter, archive=archive)
+
+    def install(report):
+        action = _get_action(report)
+        start_time = time.time()
+        element = report.config_element
+        with timed_entry(profile, element, action):
+            result = run_with_timeouts(
+                lambda: _install_journaled(report, journal,
+                                           session=session,
+                                           timeout=timeout,
+                                           verbose=verbose,
+                                           force_update=force_update),
+                element.get_local_name(),
+                element.get_path(),
+                inactivity_timeout=inactivity_timeout,
+                total_timeout=entry_timeout,
+                retries=retries)
+        if action != 'install':
+            history.record(element.get_local_name(),
+                           element.get_path_spec().get_uri(),
+                           action, time.time() - start_time)
+        return result
+
+    try:
+        preparation_reports, success = _prepare_install(
+            config, backup_path, mode, robust, localnames)
+    except MultiProjectException:
+        journal.close()
+        raise
+    if num_threads != 1:
+        # longest first, so that no long job starts last and delays the run
+        preparation_reports.sort(key=lambda report: -_get_estimate(report, history))
+    priority_pending = 0
+    if priority_localnames:
+        # results arrive in input order, so priority elements complete first
+        preparation_reports.sort(
+            key=lambda report: report.config_element.get_local_name() not in priority_localnames)
+        priority_pending = len([report for report in preparation_reports
+                                if report.config_element.get_local_name() in priority_localnames])
+    priority_failed = False
+    message = ''
+    pool, adaptive = _get_pool(preparation_reports, num_threads,
+                               jobs_per_host, host_limits, rewriter)
+    for report, _, error in pool.imap(install, preparation_reports):
+        if error is not None:
+            message += "Error processing '%s' : %s\n" % (
+                report.config_element.get_local_name(), error)
+        if priority_pending and report.config_element.get_local_name() in priority_localnames:
+            priority_failed = priority_failed or error is not None
+            priority_pending -= 1
+            if priority_pending == 0 and not priority_failed and on_priority_done is not None:
+                on_priority_done()
+    session.finish()
+    history.save()
+    if adaptive is not None:
+        _print_settled_jobs(adaptive, profile)
+    summary = session.get_summary()
+    if summary:
+        print(summary)
+    if session.archives:
+        for element in select_elements(config, localnames):
+            converted = _use_archive_element(config, element) is not element or converted
+    if converted:
+        cmd_persist_config(config)
+    if success and message == '':
+        journal.finish()
+    else:
+        journal.close()
+    if message != '':
+        print("Exception caught during install: %s" % message)
+        success = False
+        if not robust:
+            raise MultiProjectException(message)
+    return success
+
+
+def cmd_fetch(config, localnames=None, robust=False, num_threads=AUTO_JOBS,
+              cache=None, rewriter=None, profile=None, jobs_per_host=None,
+              host_limits=None, inactivity_timeout=None, entry_timeout=None,
+              retries=DEFAULT_RETRIES):
+    """
+    Downloads from remote what updating the vcs elements needs, without
+    touching their working trees, so that a later cmd_install_or_update
+    finds all objects locally. Elements not checked out yet are only
+    fetched into the reference cache, if any.
+
+    :param robust: do not raise if fetching some elements failed
+    :param num_threads: how many elements to fetch in parallel, or
+      AUTO_JOBS to adapt it to the throughput
+    :param cache: reference_cache.ReferenceCache to fetch git elements
+      into and from
+    :param rewriter: uri_rewrite.UriRewriter for fetching from mirrors
+    :param profile: RunProfile timing each element
+    :param jobs_per_host: limit of parallel jobs per host of the uris,
+      for hosts not in host_limits
+    :param host_limits: dict of host to limit of parallel jobs
+    :param inactivity_timeout: see watchdog.run_with_timeouts
+    :param entry_timeout: total_timeout of watchdog.run_with_timeouts
+    :param retries: see watchdog.run_with_timeouts
+    :returns: True on success
+    :raises MultiProjectException: if fetching some elements failed,
+      after all elements were processed, unless robust
+    """
+    elements = [element for element in select_elements(config, localnames)
+                if element.is_vcs_element()]
+    session = CheckoutSession(cache=cache, rewriter=rewriter)
+    pool, adaptive = _get_pool(elements, num_threads,
+                               jobs_per_host, host_limits, rewriter)
+
+    def fetch(element):
+        name = element.get_local_name()
+        path_spec = element.get_path_spec()
+        scmtype = path_spec.get_scmtype()
+        if not element.path_exists():
+            if (scmtype == 'git' and cache is not None and
+                    cache.update_mirror(path_spec.get_uri())):
+                return "[%s] Not checked out, fetched into the reference cache" % name
+            return "[%s] Not checked out, skipping" % name
+
+        def fetch_once():
+            result = session.fetch(scmtype, element.get_path(),
+                                   path_spec.get_version(),
+                                   path_spec.get_uri())
+            if result is False:
+                raise MultiProjectException(
+                    "[%s] Fetch failed in %s" % (name, element.get_path()))
+            return result
+        with timed_entry(profile, element, 'fetch'):
+            result = run_with_timeouts(fetch_once, name, element.get_path(),
+                                       inactivity_timeout=inactivity_timeout,
+                                       total_timeout=entry_timeout,
+                                       retries=retries)
+        if result is None:
+            return "[%s] skipped (no separate fetch for %s)" % (name, scmtype)
+        return "[%s] Done." % name
+    message = ''
+    for element, line, error in pool.imap(fetch, elements):
+        if error is not None:
+            message += "Error processing '%s' : %s\n" % (element.get_local_name(), error)
+        else:
+            print(line)
+    session.finish()
+    if adaptive is not None:
+        _print_settled_jobs(adaptive, profile)
+    if message != '':
+        print("Exception caught during fetch: %s" % message)
+        if not robust:
+            raise MultiProjectException(message)
+        return False
+    return True
+
+
+def _get_snapshot_entry(element):
+    """
+    :returns: legacy yaml dict of element pinned to its current
+      revision, None for non-vcs elements
+    """
+    if not element.is_vcs_element():
+        sys.stderr.write('Warning, discarding non-vcs element %s\n' %
+                         element.get_local_name())
+        return None
+    spec = element.get_versioned_path_spec()
+    export_spec = PathSpec(
+        local_name=spec.get_local_name(),
+        scmtype=spec.get_scmtype(),
+        uri=spec.get_uri() or spec.get_curr_uri(),
+        version=(spec.get_current_revision() or
+                 spec.get_revision() or
+                 spec.get_version()),
+        path=spec.get_path())
+    if not export_spec.get_version():
+        sys.stderr.write('Warning, no version found for element %s\n' %
+                         element.get_local_name())
+    return export_spec.get_legacy_yaml()
+
+
+def cmd_snapshot(config, localnames=None, num_threads=1):
+    """
+    Like wstool's cmd_snapshot, but queries the SCMs in num_threads
+    threads and yields each entry in config order as soon as it is
+    known.
+
+    :returns: generator of legacy yaml dicts
+    :raises MultiProjectException: if a SCM query fails
+    """
+    pool = WorkerPool(num_threads)
+    for element, source, error in pool.imap(_get_snapshot_entry,
+                                            select_elements(config, localnames),
+                                            max_pending=pool.num_threads):
+        if error is not None:
+            raise MultiProjectException("Error processing '%s' : %s" %
+                                        (element.get_local_name(), error))
+        if source is not None:
+            yield source
+
+
+def write_snapshot(sources, fhand):
+    """
+    Writes sources as yaml list to fhand one entry at a time, the
+    result is the same as dumping the whole list.
+    """
+    empty = True
+    for source in sources:
+        fhand.write(yaml.safe_dump([source]))
+        fhand.flush()
+        empty = False
+    if empty:
+        fhand.write(yaml.safe_dump([]))
+
+
+def _iter_vcs_results(config, localnames, func, num_threads):
+    """
+    Runs func on the vcs elements in num_threads threads, yielding
+    (element, result) in config order, while holding at most about
+    num_threads results in memory. Elements for which func fails are
+    left out.
+
+    :raises MultiProjectException: if func failed for some elements,
+      after all others were yielded
+    """
+    elements = [element for element in select_elements(config, localnames)
+                if element.is_vcs_element()]
+    pool = WorkerPool(num_threads)
+    message = ''
+    for element, result, error in pool.imap(func, elements,
+                                            max_pending=pool.num_threads):
+        if error is not None:
+            message += "Error processing '%s' : %s\n" % (element.get_local_name(), error)
+        else:
+            yield element, result
+    if message != '':
+        raise MultiProjectException(message)
+
+
+def cmd_diff(config, localnames=None, num_threads=1):
+    """
+    Like wstool's cmd_diff, but yields the diff of each vcs element
+    relative to the workspace in config order as soon as it is known.
+
+    :returns: generator of diff strings, None if a SCM has no diff
+    """
+    path = config.get_base_path()
+    for _, diff in _iter_vcs_results(config, localnames,
+                                     lambda element: element.get_diff(path),
+                                     num_threads):
+        yield diff
+
+
+def _get_info(element, base_path, untracked, fetch):
+    """
+    :returns: dict describing the state of element as wstool's
+      cmd_info, for cli_common.get_info_table
+    """
+    localname = element.get_local_name()
+    if localname is None or localname == "":
+        raise MultiProjectException(
+            "Missing local-name in element: %s" % element)
+    path = element.get_path() or localname
+    exists = os.path.exists(normabspath(path, base_path))
+    scm = None
+    uri = ""
+    curr_uri = None
+    # what is given in the config file
+    version = ""
+    # e.g. branch name
+    curr_version_label = ""
+    # UID on remote
+    remote_revision = ""
+    # git default branch
+    default_remote_label = None
+    modified = ""
+    # revision number of the current version
+    currevision = ""
+    # revision number of version
+    specversion = ""
+    if element.is_vcs_element():
+        if not exists:
+            path_spec = element.get_path_spec()
+            version = path_spec.get_version()
+        else:
+            path_spec = element.get_versioned_path_spec(fetch=fetch)
+            version = path_spec.get_version()
+            remote_revision = path_spec.get_remote_revision()
+            curr_version_label = path_spec.get_curr_version()
+            curr_uri = path_spec.get_curr_uri()
+            status = element.get_status(base_path, untracked)
+            if status is not None and status.strip() != '':
+                modified = True
+            specversion = path_spec.get_revision()
+            if (version is not None and version.strip() != '' and
+                    (specversion is None or specversion.strip() == '')):
+                specversion = '"%s"' % version
+            if fetch and specversion is None and path_spec.get_scmtype() == 'git':
+                default_remote_label = element.get_default_remote_label()
+            currevision = path_spec.get_current_revision()
+        scm = path_spec.get_scmtype()
+        uri = path_spec.get_uri()
+    return {'entry': element.get_path_spec(),
+            'scm': scm,
+            'exists': exists,
+            'localname': localname,
+            'path': path,
+            'uri': uri,
+            'curr_uri': curr_uri,
+            'version': version,
+            'remote_revision': remote_revision,
+            'default_remote_label': default_remote_label,
+            'curr_version_label': curr_version_label,
+            'specversion': specversion,
+            'actualversion': currevision,
+            'modified': modified,
+            'properties': element.get_properties()}
+
+
+def cmd_info(config, localnames=None, untracked=False, fetch=False, num_threads=1):
+    """
+    Like wstool's cmd_info, but queries the SCMs in num_threads
+    threads instead of one thread per element.
+
+    :param untracked: also count files not added to the SCM as
+      modifications
+    :param fetch: query the remote versions
+    :returns: list of dicts for cli_common.get_info_table, in config
+      order, without setup-file elements
+    :raises MultiProjectException: if SCM queries failed, after all
+      elements were queried
+    """
+    path = config.get_base_path()
+    elements = [element for element in select_elements(config, localnames)
+                if element.get_properties() is None or
+                'setup-file' not in element.get_properties()]
+    pool = WorkerPool(num_threads)
+    outputs = []
+    message = ''
+    for element, info, error in pool.imap(
+            lambda element: _get_info(element, path, untracked, fetch), elements):
+        if error is not None:
+            message += "Error processing '%s' : %s\n" % (element.get_local_name(), error)
+        else:
+            outputs.append(info)
+    if message != '':
+        raise MultiProjectException(message)
+    return outputs
+
+
+def _align_status(scmtype, status):
+    """
+    aligns the status columns of other SCMs to svn
+    """
+    columns = {'git': 3, 'hg': 2, 'bzr': 4}.get(scmtype)
+    if columns is None or status is None:
+        return status
+    return ''.join(["%s%s\n" % (line[:columns].ljust(8), line[columns:])
+                    for line in status.splitlines()])
+
+
+def cmd_status(config, localnames=None, untracked=False, num_threads=1):
+    """
+    Like wstool's cmd_status, but yields the status of each vcs element
+    relative to the workspace in config order as soon as it is known.
+
+    :param untracked: also show files not added to the SCM
+    :returns: generator of status strings, None if a SCM has no status
+    """
+    path = config.get_base_path()
+
+    def get_status(element):
+        return _align_status(element.get_path_spec().get_scmtype(),
+                             element.get_status(path, untracked))
+    for _, status in _iter_vcs_results(config, localnames, get_status, num_threads):
+        yield status
+
+
+BOOTSTRAP_FINGERPRINT_FILENAME = '.rosinstall_bootstrap'
+_BOOTSTRAP_CURRENT_MSG = ("ROS build bootstrap is up to date with the core ros trees, "
+                          "skipping it (use --force-bootstrap to rerun it)")
+
+
 def _ros_requires_boostrap(config):
     """
     Tests whether workspace contains a core ros stack, to decide
@@ -79,7 +761,113 @@ def cmd_maybe_refresh_ros_files(config):
         setupfiles.generate_setup(config, no_ros_allowed=True)
 
 
-def cmd_generate_ros_files(config, path, nobuild=False, rosdep_yes=False, catkin=False, catkinpp=None, no_ros_allowed=False):
+def get_bootstrap_localnames(config):
+    """
+    :returns: local names of the elements the ROS build bootstrap
+      needs: the core ros stack, ros_comm and setup files
+    """
+    localnames = []
+    for tree_el in config.get_config_elements():
+        if (isinstance(tree_el, SetupConfigElement) or
+                os.path.basename(tree_el.get_path()) in ['ros', 'ros_comm'] or
+                is_path_ros(tree_el.get_path())):
+            localnames.append(tree_el.get_local_name())
+    return localnames
+
+
+def _get_bootstrap_cmd(config, path, rosdep_yes):
+    rosdep_yes_insert = ""
+    if rosdep_yes:
+        rosdep_yes_insert = " --rosdep-yes"
+    ros_comm_insert = ""
+    if 'ros_comm' in [os.path.basename(tree.get_path()) for tree in config.get_config_elements()]:
+        print("Detected ros_comm bootstrapping it too.")
+        ros_comm_insert = " ros_comm"
+    return ("source %s && rosmake ros%s --rosdep-install%s" %
+            (os.path.join(path, 'setup.sh'),
+             ros_comm_insert,
+             rosdep_yes_insert))
+
+
+def _get_bootstrap_fingerprint(config, cmd):
+    """
+    :returns: hash of the bootstrap command and of revision and local
+      changes of the core trees it builds, None if a revision is unknown
+    """
+    digest = hashlib.sha1(cmd.encode('utf-8'))
+    for tree_el in config.get_config_elements():
+        path = tree_el.get_path()
+        if not (tree_el.is_vcs_element() and
+                (os.path.basename(path) in ['ros', 'ros_comm'] or is_path_ros(path))):
+            continue
+        client = vcstools.get_vcs_client(tree_el.get_path_spec().get_scmtype(), path)
+        revision = client.get_version()
+        if revision is None:
+            return None
+        status = client.get_status() or ''
+        digest.update(('%s %s\n%s\n' % (path, revision, status)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_bootstrap_current(config, cmd):
+    fingerprint = _get_bootstrap_fingerprint(config, cmd)
+    fingerprint_path = os.path.join(config.get_base_path(), BOOTSTRAP_FINGERPRINT_FILENAME)
+    if fingerprint is None or not os.path.isfile(fingerprint_path):
+        return False
+    with open(fingerprint_path, 'r') as fhand:
+        return fhand.read().strip() == fingerprint
+
+
+def _record_bootstrap(config, cmd):
+    """
+    Stores the fingerprint of a successful bootstrap
+    """
+    fingerprint = _get_bootstrap_fingerprint(config, cmd)
+    if fingerprint is not None:
+        fingerprint_path = os.path.join(config.get_base_path(), BOOTSTRAP_FINGERPRINT_FILENAME)
+        with open(fingerprint_path, 'w') as fhand:
+            fhand.write(fingerprint + '\n')
+
+
+def cmd_start_ros_bootstrap(config, path, rosdep_yes=False, force=False, profile=None):
+    """
+    Generates the setup files and starts the ROS build bootstrap in
+    the background, if the core ROS stack is present. Its output goes
+    to rosmake_bootstrap.log in the workspace, it cannot read input.
+
+    :param rosdep_yes: must be True, else rosdep would wait for
+      confirmation that nobody can give, so that cmd_generate_ros_files
+      has to bootstrap in the foreground instead
+    :param force: bootstrap even if the core trees did not change since
+      the last successful bootstrap
+    :param profile: RunProfile timing setup generation and bootstrap,
+      the latter until cmd_generate_ros_files waited for it
+    :returns: (Popen, log path, cmd) to pass to cmd_generate_ros_files, or None
+    """
+    print("(Over-)Writing setup.sh, setup.bash, and setup.zsh in %s" %
+          config.get_base_path())
+    with timed_phase(profile, 'setup'):
+        setupfiles.generate_setup(config, no_ros_allowed=True)
+    if not rosdep_yes or not _ros_requires_boostrap(config):
+        return None
+    cmd = _get_bootstrap_cmd(config, path, rosdep_yes)
+    if not force and _is_bootstrap_current(config, cmd):
+        print(_BOOTSTRAP_CURRENT_MSG)
+        return None
+    log_path = os.path.join(config.get_base_path(), 'rosmake_bootstrap.log')
+    print("Bootstrapping ROS build in the background, logging to %s" % log_path)
+    if profile is not None:
+        profile.begin_phase('bootstrap', track='rosmake bootstrap')
+    with open(log_path, 'w') as log_file:
+        with open(os.devnull, 'r') as devnull:
+            process = subprocess.Popen(cmd,
+                                       shell=True, executable='/bin/bash',
+                                       stdin=devnull,
+                                       stdout=log_file, stderr=subprocess.STDOUT)
+    return process, log_path, cmd
+
+
+def cmd_generate_ros_files(config, path, nobuild=False, rosdep_yes=False, catkin=False, catkinpp=None, no_ros_allowed=False, bootstrap=None, force_bootstrap=False, profile=None):
     """
     Generates ROS specific setup files
 
@@ -88,6 +876,11 @@ def cmd_generate_ros_files(config, path, nobuild=False, rosdep_yes=False, catkin
     :param catkin: if true, generates catkin(fuerte) CMakeLists.txt instead of invoking rosmake
     :param catkinpp: Prefix path for catkin if generating for catkin
     :param no_ros_allowed: if true, does not look for a core ros stack
+    :param bootstrap: result of cmd_start_ros_bootstrap, waited for
+      instead of bootstrapping again
+    :param force_bootstrap: bootstrap even if the core trees did not
+      change since the last successful bootstrap
+    :param profile: RunProfile timing setup generation and bootstrap
     """
 
     # Catkin must be enabled if catkinpp is set
@@ -96,25 +889,31 @@ def cmd_generate_ros_files(config, path, nobuild=False, rosdep_yes=False, catkin
 
     ## bootstrap the build if installing ros
     if catkin:
-        setupfiles.generate_catkin_cmake(path, catkinpp)
+        with timed_phase(profile, 'setup'):
+            setupfiles.generate_catkin_cmake(path, catkinpp)
 
     else:  # DRY install case
         ## Generate setup.sh and save
         print("(Over-)Writing setup.sh, setup.bash, and setup.zsh in %s" %
               config.get_base_path())
-        setupfiles.generate_setup(config, no_ros_allowed)
-
-        if _ros_requires_boostrap(config) and not nobuild:
-            print("Bootstrapping ROS build")
-            rosdep_yes_insert = ""
-            if rosdep_yes:
-                rosdep_yes_insert = " --rosdep-yes"
-            ros_comm_insert = ""
-            if 'ros_comm' in [os.path.basename(tree.get_path()) for tree in config.get_config_elements()]:
-                print("Detected ros_comm bootstrapping it too.")
-                ros_comm_insert = " ros_comm"
-            cmd = ("source %s && rosmake ros%s --rosdep-install%s" %
-                   (os.path.join(path, 'setup.sh'),
-                    ros_comm_insert,
-                    rosdep_yes_insert))
-            subprocess.check_call(cmd, shell=True, executable='/bin/bash')
+        with timed_phase(profile, 'setup'):
+            setupfiles.generate_setup(config, no_ros_allowed)
+
+        if bootstrap is not None:
+            process, log_path, cmd = bootstrap
+            print("Waiting for ROS build bootstrap, see %s" % log_path)
+            returncode = process.wait()
+            if profile is not None:
+                profile.end_phase('bootstrap', returncode == 0)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, 'rosmake')
+            _record_bootstrap(config, cmd)
+        elif _ros_requires_boostrap(config) and not nobuild:
+            cmd = _get_bootstrap_cmd(config, path, rosdep_yes)
+            if not force_bootstrap and _is_bootstrap_current(config, cmd):
+                print(_BOOTSTRAP_CURRENT_MSG)
+            else:
+                print("Bootstrapping ROS build")
+                with timed_phase(profile, 'bootstrap'):
+                    subprocess.check_call(cmd, shell=True, executable='/bin/bash')
+                _record_bootstrap(config, cmd)
@@ -43,15 +43,21 @@ Type '%(prog)s help' for usage.
 from __future__ import print_function
 import os
 import sys
-import yaml
 
 from optparse import OptionParser
 
 from wstool.cli_common import get_info_list, get_info_table, \
     get_info_table_raw_csv, get_workspace, ONLY_OPTION_VALID_ATTRS
 import rosinstall.rosinstall_cmd as rosinstall_cmd
-from wstool.multiproject_cmd import get_config, cmd_install_or_update, \
-    cmd_snapshot, cmd_version, cmd_info, cmd_find_unmanaged_repos
+import rosinstall.remote_config as remote_config
+from rosinstall.reference_cache import get_reference_cache
+from rosinstall.uri_rewrite import load_rewrite_rules
+from rosinstall.host_limits import load_host_limits
+from rosinstall.parallel import parse_jobs, get_cpu_count, AUTO_JOBS
+from rosinstall.profiling import RunProfile, timed_phase
+from rosinstall.install_options import add_install_options, get_install_mode
+from wstool.multiproject_cmd import get_config, \
+    cmd_version, cmd_find_unmanaged_repos
 import rosinstall.__version__
 
 from wstool.common import MultiProjectException, select_elements
@@ -68,8 +74,10 @@ from wstool.multiproject_cli import MultiprojectCLI, __MULTIPRO_CMD_DICT__, \
 __ROSWS_CMD_DICT__ = {}
 __ROSWS_CMD_DICT__.update(__MULTIPRO_CMD_DICT__)
 __ROSWS_CMD_DICT__["regenerate"] = "create ROS workspace specific setup files"
+__ROSWS_CMD_DICT__["fetch"] = "download remote changes of some config elements, without updating them"
 
 __ROSWS_CMD_HELP_LIST__ = __MULTIPRO_CMD_HELP_LIST__[:]
+__ROSWS_CMD_HELP_LIST__.insert(__ROSWS_CMD_HELP_LIST__.index('update') + 1, 'fetch')
 __ROSWS_CMD_HELP_LIST__.extend([None, 'regenerate'])
 
 _PROGNAME = 'rosws'
@@ -116,8 +124,12 @@ $ %(prog)s init ~/fuerte /opt/ros/fuerte
                           help="Continue despite checkout errors",
                           action="store_true")
         parser.add_option("-j", "--parallel", dest="jobs", default=1,
-                          help="How many parallel threads to use for installing",
+                          help="How many parallel threads to use for installing, 'auto' adapts it to the throughput",
                           action="store")
+        parser.add_option("--offline", dest="offline", default=False,
+                          help="Use cached copies of rosinstall sources given by URL instead of downloading them",
+                          action="store_true")
+        add_install_options(parser)
         (options, args) = parser.parse_args(argv)
         if len(args) < 1:
             target_path = '.'
@@ -142,37 +154,234 @@ $ %(prog)s init ~/fuerte /opt/ros/fuerte
         if len(config_uris) > 0:
             print('Using ROS_ROOT: %s' % config_uris[0])
 
-        config = get_config(basepath=target_path,
-                            additional_uris=config_uris,
-                            config_filename=self.config_filename)
+        profile = None
+        if options.profile or options.trace:
+            profile = RunProfile('rosws init', jobs=parse_jobs(options.jobs))
+        try:
+            with timed_phase(profile, 'config'):
+                config = remote_config.get_config(basepath=target_path,
+                                                  additional_uris=config_uris,
+                                                  config_filename=self.config_filename,
+                                                  cache=remote_config.get_source_cache(),
+                                                  offline=options.offline)
+
+            # includes ROS specific files
+
+            print("Writing %s" % os.path.join(config.get_base_path(),
+                  self.config_filename))
+            rosinstall_cmd.cmd_persist_config(config)
+
+            ## install or update each element
+            with timed_phase(profile, 'install'):
+                install_success = rosinstall_cmd.cmd_install_or_update(
+                    config,
+                    robust=False,
+                    num_threads=parse_jobs(options.jobs),
+                    cache=get_reference_cache(options.cache_dir),
+                    rewriter=load_rewrite_rules(),
+                    archive=options.archive,
+                    profile=profile,
+                    jobs_per_host=options.jobs_per_host,
+                    host_limits=load_host_limits(),
+                    inactivity_timeout=options.inactivity_timeout,
+                    entry_timeout=options.entry_timeout,
+                    retries=options.retries)
+
+            rosinstall_cmd.cmd_generate_ros_files(config,
+                                                  target_path,
+                                                  nobuild=True,
+                                                  rosdep_yes=False,
+                                                  catkin=options.catkin,
+                                                  catkinpp=options.catkinpp,
+                                                  no_ros_allowed=True,
+                                                  profile=profile)
+
+            if not install_success:
+                print("Warning: installation encountered errors, but --continue-on-error was requested.  Look above for warnings.")
+            print("\nrosinstall update complete.")
+            if (options.catkin is False
+                and options.catkinpp is None):
+                print("\nType 'source %s/setup.bash' to change into this environment. Add that source command to the bottom of your ~/.bashrc to set it up every time you log in.\n\nIf you are not using bash please see http://www.ros.org/wiki/rosinstall/NonBashShells " % os.path.abspath(target_path))
+            return 0
+        finally:
+            if options.profile:
+                profile.write(options.profile)
+            if options.trace:
+                profile.write_trace(options.trace)
+
+    def cmd_update(self, target_path, argv, config=None):
+        parser = OptionParser(usage="usage: %s update [localname]*" % self.progname,
+                              formatter=IndentedHelpFormatterWithNL(),
+                              description=__MULTIPRO_CMD_DICT__["update"] + """
 
-        # includes ROS specific files
+This command calls the SCM provider to pull changes from remote to
+your local filesystem. In case the url has changed, the command will
+ask whether to delete or backup the folder.
 
-        print("Writing %s" % os.path.join(config.get_base_path(),
-              self.config_filename))
-        rosinstall_cmd.cmd_persist_config(config)
+Examples:
+$ %(progname)s update -t ~/fuerte
+$ %(progname)s update robot_model geometry
+""" % {'progname': self.progname},
+                              epilog="See: http://www.ros.org/wiki/rosinstall for details\n")
+        parser.add_option("--delete-changed-uris", dest="delete_changed",
+                          default=False,
+                          help="Delete the local copy of a directory before changing uri.",
+                          action="store_true")
+        parser.add_option("--abort-changed-uris", dest="abort_changed",
+                          default=False,
+                          help="Abort if changed uri detected",
+                          action="store_true")
+        parser.add_option("--continue-on-error", dest="robust",
+                          default=False,
+                          help="Continue despite checkout errors",
+                          action="store_true")
+        parser.add_option("--backup-changed-uris", dest="backup_changed",
+                          default='',
+                          help="backup the local copy of a directory before changing uri to this directory.",
+                          action="store")
+        parser.add_option("-m", "--timeout", dest="timeout",
+                          default=None,
+                          help="How long to wait for each repo before failing [seconds]",
+                          action="store", type=float)
+        parser.add_option("-j", "--parallel", dest="jobs",
+                          default=1,
+                          help="How many parallel threads to use for installing, 'auto' adapts it to the throughput",
+                          action="store")
+        parser.add_option("-v", "--verbose", dest="verbose",
+                          default=False,
+                          help="Whether to print out more information",
+                          action="store_true")
+        parser.add_option("--force-update", dest="force_update", default=False,
+                          help="Also update entries already at their pinned tag or commit id",
+                          action="store_true")
+        parser.add_option("--resume", dest="resume", default=False,
+                          help="Skip entries completed by an interrupted run in this workspace",
+                          action="store_true")
+        add_install_options(parser)
+        # -t option required here for help but used one layer above, see cli_common
+        parser.add_option("-t", "--target-workspace", dest="workspace",
+                          default=None,
+                          help="which workspace to use",
+                          action="store")
+        (options, args) = parser.parse_args(argv)
+        mode = get_install_mode(parser, options)
 
-        ## install or update each element
-        install_success = cmd_install_or_update(
-            config,
-            robust=False,
-            num_threads=int(options.jobs))
+        profile = None
+        if options.profile or options.trace:
+            profile = RunProfile('rosws update', jobs=parse_jobs(options.jobs))
+        try:
+            if config is None:
+                with timed_phase(profile, 'config'):
+                    config = get_config(target_path,
+                                        additional_uris=[],
+                                        config_filename=self.config_filename)
+            elif config.get_base_path() != target_path:
+                raise MultiProjectException("Config path does not match %s %s " % (
+                    config.get_base_path(),
+                    target_path))
+            if args == []:
+                # None means no filter, [] means filter all
+                args = None
+            with timed_phase(profile, 'install'):
+                install_success = rosinstall_cmd.cmd_install_or_update(
+                    config,
+                    localnames=args,
+                    backup_path=options.backup_changed,
+                    mode=mode,
+                    robust=options.robust,
+                    num_threads=parse_jobs(options.jobs),
+                    timeout=options.timeout,
+                    verbose=options.verbose,
+                    cache=get_reference_cache(options.cache_dir),
+                    rewriter=load_rewrite_rules(),
+                    archive=options.archive,
+                    force_update=options.force_update,
+                    resume=options.resume,
+                    profile=profile,
+                    jobs_per_host=options.jobs_per_host,
+                    host_limits=load_host_limits(),
+                    inactivity_timeout=options.inactivity_timeout,
+                    entry_timeout=options.entry_timeout,
+                    retries=options.retries)
+            if install_success or options.robust:
+                return 0
+            return 1
+        finally:
+            if options.profile:
+                profile.write(options.profile)
+            if options.trace:
+                profile.write_trace(options.trace)
+
+    def cmd_fetch(self, target_path, argv, config=None):
+        parser = OptionParser(usage="usage: %s fetch [localname]*" % self.progname,
+                              formatter=IndentedHelpFormatterWithNL(),
+                              description=__ROSWS_CMD_DICT__["fetch"] + """
 
-        rosinstall_cmd.cmd_generate_ros_files(config,
-                                              target_path,
-                                              nobuild=True,
-                                              rosdep_yes=False,
-                                              catkin=options.catkin,
-                                              catkinpp=options.catkinpp,
-                                              no_ros_allowed=True)
+This command downloads from remote what '%(progname)s update' would
+need, for all entries in parallel, without changing any working tree.
+An update afterwards finds all objects locally. Entries not checked
+out yet are only fetched into the reference cache, if any. svn and bzr
+cannot fetch without updating, their entries are reported as skipped.
 
-        if not install_success:
-            print("Warning: installation encountered errors, but --continue-on-error was requested.  Look above for warnings.")
-        print("\nrosinstall update complete.")
-        if (options.catkin is False
-            and options.catkinpp is None):
-            print("\nType 'source %s/setup.bash' to change into this environment. Add that source command to the bottom of your ~/.bashrc to set it up every time you log in.\n\nIf you are not using bash please see http://www.ros.org/wiki/rosinstall/NonBashShells " % os.path.abspath(target_path))
-        return 0
+Examples:
+$ %(progname)s fetch -t ~/fuerte -j 8
+$ %(progname)s fetch robot_model geometry
+""" % {'progname': self.progname},
+                              epilog="See: http://www.ros.org/wiki/rosinstall for details\n")
+        parser.add_option("--continue-on-error", dest="robust",
+                          default=False,
+                          help="Continue despite fetch errors",
+                          action="store_true")
+        parser.add_option("-j", "--parallel", dest="jobs",
+                          default=AUTO_JOBS,
+                          help="How many parallel threads to use for fetching, defaults to 'auto', which adapts it to the throughput",
+                          action="store")
+        add_install_options(parser, fetch=True)
+        # -t option required here for help but used one layer above, see cli_common
+        parser.add_option("-t", "--target-workspace", dest="workspace",
+                          default=None,
+                          help="which workspace to use",
+                          action="store")
+        (options, args) = parser.parse_args(argv)
+
+        profile = None
+        if options.profile or options.trace:
+            profile = RunProfile('rosws fetch', jobs=parse_jobs(options.jobs))
+        try:
+            if config is None:
+                with timed_phase(profile, 'config'):
+                    config = get_config(target_path,
+                                        additional_uris=[],
+                                        config_filename=self.config_filename)
+            elif config.get_base_path() != target_path:
+                raise MultiProjectException("Config path does not match %s %s " % (
+                    config.get_base_path(),
+                    target_path))
+            if args == []:
+                # None means no filter, [] means filter all
+                args = None
+            with timed_phase(profile, 'fetch'):
+                fetch_success = rosinstall_cmd.cmd_fetch(
+                    config,
+                    localnames=args,
+                    robust=options.robust,
+                    num_threads=parse_jobs(options.jobs),
+                    cache=get_reference_cache(options.cache_dir),
+                    rewriter=load_rewrite_rules(),
+                    profile=profile,
+                    jobs_per_host=options.jobs_per_host,
+                    host_limits=load_host_limits(),
+                    inactivity_timeout=options.inactivity_timeout,
+                    entry_timeout=options.entry_timeout,
+                    retries=options.retries)
+            if fetch_success or options.robust:
+                return 0
+            return 1
+        finally:
+            if options.profile:
+                profile.write(options.profile)
+            if options.trace:
+                profile.write_trace(options.trace)
 
     def cmd_regenerate(self, target_path, argv, config=None):
         parser = OptionParser(usage="usage: %s regenerate" % self.progname,
@@ -286,6 +495,10 @@ $ %(prog)s info --only=path,cur_uri,cur_revision robot_model geometry
             "--fetch", dest="fetch", default=False,
             help="When used, retrieves version information from remote (takes longer).",
             action="store_true")
+        parser.add_option(
+            "-j", "--parallel", dest="jobs", default=AUTO_JOBS,
+            help="How many parallel threads to use for querying SCMs, defaults to the number of CPUs",
+            action="store")
         parser.add_option(
             "-u", "--untracked", dest="untracked",
             default=False,
@@ -336,14 +549,17 @@ $ %(prog)s info --only=path,cur_uri,cur_revision robot_model geometry
             print('\n'.join(lines))
             return 0
         elif options.yaml:
-            source_aggregate = cmd_snapshot(config, localnames=args)
-            print(yaml.safe_dump(source_aggregate), end='')
+            rosinstall_cmd.write_snapshot(
+                rosinstall_cmd.cmd_snapshot(config, localnames=args,
+                                            num_threads=parse_jobs(options.jobs, get_cpu_count())),
+                sys.stdout)
             return 0
 
         # this call takes long, as it invokes scms.
-        outputs = cmd_info(config, localnames=args,
-                           untracked=options.untracked,
-                           fetch=options.fetch)
+        outputs = rosinstall_cmd.cmd_info(config, localnames=args,
+                                          untracked=options.untracked,
+                                          fetch=options.fetch,
+                                          num_threads=parse_jobs(options.jobs, get_cpu_count()))
         if args and len(args) == 1:
             # if only one element selected, print just one line
             print(get_info_list(config.get_base_path(),
@@ -445,7 +661,8 @@ def rosws_main(argv=None, usage=None):
             'scrape': cli.cmd_scrape,
             'diff': cli.cmd_diff,
             'status': cli.cmd_status,
-            'update': cli.cmd_update}
+            'update': cli.cmd_update,
+            'fetch': cli.cmd_fetch}
         for label in list(ws_commands.keys()):
             alias = __MULTIPRO_CMD_ALIASES__.get(label, None)
             if alias:
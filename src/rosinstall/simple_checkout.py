@@ -30,25 +30,842 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+from __future__ import print_function
+
+import logging
+import os
+import re
+import shutil
+import subprocess
 import sys
+import tarfile
+import threading
+import time
+import yaml
 import vcstools
+from vcstools.git import GitError
+from contextlib import contextmanager
+from wstool.common import MultiProjectException
 from wstool.config_yaml import get_path_spec_from_yaml
 
+from rosinstall.archive import fetch_archive, get_archive_url, get_archive_cache_dir
+from rosinstall.parallel import WorkerPool
+from rosinstall.watchdog import DEFAULT_RETRIES, run_with_timeouts
+
+
+def _parse_rosinstall_chunk(lines):
+    try:
+        data = yaml.safe_load(''.join(lines))
+    except yaml.YAMLError as yame:
+        raise MultiProjectException("Invalid yaml in input: %s" % yame)
+    if data is None:
+        # only comments or blank lines
+        return []
+    if not type(data) == list:
+        raise MultiProjectException("input must be a rosinstall snippet")
+    return data
+
+
+_DOCUMENT_MARKER = re.compile(r'^(---|\.\.\.)(\s|$)')
+_SEQUENCE_ITEM = re.compile(r'^( *)-(\s|$)')
+
+
+def _is_top_level_comment(line, indent):
+    """
+    :returns: True if line is blank or a comment not indented deeper
+      than indent
+    """
+    stripped = line.lstrip(' ')
+    return (not stripped.strip() or
+            (stripped.startswith('#') and len(line) - len(stripped) <= indent))
+
+
+def iter_rosinstall_yaml(stream):
+    """
+    Parses a rosinstall yaml list incrementally, yielding each entry
+    as soon as it is complete: when the next top-level sequence item
+    starts, at a document marker '---' or '...', or at the end of the
+    stream. Comments and blank lines between items are skipped. Input
+    not in block style is only parsed once the stream ends.
+
+    :param stream: file-like object, e.g. sys.stdin
+    :raises: MultiProjectException for invalid yaml
+    """
+    chunk = []
+    # comments and blank lines after the current item, which belong to
+    # it only if the item continues after them
+    pending = []
+    indent = None
+    # readline avoids the read-ahead buffering of file iteration
+    for line in iter(stream.readline, ''):
+        marker = _DOCUMENT_MARKER.match(line)
+        if marker:
+            for entry in _parse_rosinstall_chunk(chunk):
+                yield entry
+            chunk = []
+            pending = []
+            indent = None
+            # e.g. '--- # comment' or '--- [...]'
+            line = line[marker.end(1):]
+            if not line.strip():
+                continue
+        item = _SEQUENCE_ITEM.match(line)
+        if item and indent is None and all([_is_top_level_comment(previous, len(previous))
+                                            for previous in chunk]):
+            # first item of the document
+            indent = len(item.group(1))
+        if item and len(item.group(1)) == indent and chunk:
+            for entry in _parse_rosinstall_chunk(chunk):
+                yield entry
+            chunk = []
+            pending = []
+        elif indent is not None and _is_top_level_comment(line, indent):
+            pending.append(line)
+            continue
+        chunk.extend(pending)
+        pending = []
+        chunk.append(line)
+    for entry in _parse_rosinstall_chunk(chunk):
+        yield entry
+
+
+def _run_git(args, cwd=None):
+    """
+    :returns: True if the git command succeeded, its output is discarded
+    """
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(['git'] + args, cwd=cwd,
+                               stdout=devnull, stderr=devnull) == 0
+
+
+def _call_git(args, cwd=None, timeout=None):
+    """
+    Runs git, killing it after timeout seconds, if given.
+
+    :returns: (True if the command succeeded, its stderr output)
+    """
+    proc = subprocess.Popen(['git'] + args, cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    expired = []
+
+    def kill():
+        expired.append(True)
+        proc.kill()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        stderr = proc.communicate()[1]
+    finally:
+        if timer is not None:
+            timer.cancel()
+    stderr = stderr.decode('utf-8', 'replace').strip()
+    if expired:
+        stderr = (stderr + '\n' if stderr else '') + 'timed out after %ss' % timeout
+    return proc.returncode == 0, stderr
+
+
+def _get_output(cmd, cwd=None):
+    """
+    :returns: stripped output of cmd, or None if it failed
+    """
+    with open(os.devnull, 'w') as devnull:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=devnull)
+        output = proc.communicate()[0]
+    if proc.returncode != 0:
+        return None
+    return output.decode('utf-8').strip()
+
+
+def is_at_pinned_version(scmtype, path, version):
+    """
+    Checks locally, without network access, whether the checkout at
+    path is at version and version is immutable: a git tag or commit
+    id, or a hg changeset id. Branches are never considered pinned.
+
+    :returns: True if updating the checkout would change nothing
+    """
+    if not version:
+        return False
+    is_commit_id = re.match(r'^[0-9a-f]{7,40}$', version) is not None
+    if scmtype == 'git':
+        head = _get_output(['git', 'rev-parse', '-q', '--verify', 'HEAD'], cwd=path)
+        if head is None:
+            return False
+        if is_commit_id and head.startswith(version):
+            return True
+        tag = _get_output(['git', 'rev-parse', '-q', '--verify',
+                           'refs/tags/%s^{commit}' % version], cwd=path)
+        return tag == head
+    if scmtype == 'hg' and is_commit_id:
+        node = _get_output(['hg', 'log', '-r', '.', '--template', '{node}'], cwd=path)
+        return node is not None and node.startswith(version)
+    return False
+
+
+def _get_dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            if not os.path.islink(filepath):
+                size += os.path.getsize(filepath)
+    return size
+
+
+def _set_remote_uri(scmtype, path, uri):
+    """
+    Point the checkout at path back to uri after fetching from elsewhere.
+
+    :returns: True on success
+    """
+    if scmtype == 'git':
+        return _run_git(['remote', 'set-url', 'origin', uri], cwd=path)
+    with open(os.devnull, 'w') as devnull:
+        if scmtype == 'svn':
+            return subprocess.call(['svn', 'relocate', uri], cwd=path,
+                                   stdout=devnull, stderr=devnull) == 0
+        if scmtype == 'bzr':
+            return subprocess.call(['bzr', 'config', 'parent_location=%s' % uri],
+                                   cwd=path, stdout=devnull, stderr=devnull) == 0
+    if scmtype == 'hg':
+        _set_hgrc_default(os.path.join(path, '.hg', 'hgrc'), uri)
+    return True
+
+
+def _set_hgrc_default(hgrc, uri):
+    """
+    Sets default in the [paths] section of hgrc to uri, keeping all
+    other settings.
+    """
+    lines = []
+    if os.path.isfile(hgrc):
+        with open(hgrc, 'r') as hgrc_file:
+            lines = hgrc_file.read().splitlines()
+    result = []
+    section = None
+    done = False
+    in_default = False
+    for line in lines:
+        if in_default and line[:1] in [' ', '\t'] and line.strip():
+            # continuation of the old value
+            continue
+        in_default = False
+        header = re.match(r'^\[([^\]]*)\]', line)
+        if header:
+            if section == 'paths' and not done:
+                result.append('default = %s' % uri)
+                done = True
+            section = header.group(1).strip()
+        elif section == 'paths' and not done and re.match(r'^default\s*=', line):
+            line = 'default = %s' % uri
+            done = in_default = True
+        result.append(line)
+    if not done:
+        if section != 'paths':
+            result.append('[paths]')
+        result.append('default = %s' % uri)
+    with open(hgrc, 'w') as hgrc_file:
+        hgrc_file.write('\n'.join(result) + '\n')
+
+
+class _SharedClone(object):
+    """Tracks the first checkout of a repository other checkouts copy from"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.path = None
+        self.duration = 0
+        self.size = None
+
+
+def get_meta_options(tags):
+    """
+    :param tags: tags of a PathSpec, or properties of a config element
+    :returns: dict of the options in the 'meta' key of a rosinstall
+      entry, e.g. {'shallow': True}
+    """
+    meta = {}
+    for tag in tags or []:
+        if type(tag) == dict and type(tag.get('meta')) == dict:
+            meta.update(tag['meta'])
+    return meta
+
+
+def _is_shallow_git(path):
+    return os.path.isfile(os.path.join(path, '.git', 'shallow'))
+
+
+class CheckoutSession(object):
+    """
+    Performs the checkouts of one rosinstall / rosco run. git entries
+    sharing a URI (e.g. several packages released from the same
+    repository) are fetched from remote only once, further checkouts
+    are cloned from the local object store of the first one, with the
+    origin set back to the URI.
+
+    git entries may also be cloned shallow (only the pinned version,
+    no history) or partial (file contents fetched on demand), per
+    session or per entry via the 'meta' key of the rosinstall entry.
+
+    With a reference_cache.ReferenceCache, git entries are cloned from
+    its machine-wide mirrors instead.
+
+    With a uri_rewrite.UriRewriter, entries are fetched from the
+    rewritten URI, falling back to the original URI on failure. The
+    checkout remote is set back to the original URI.
+
+    In archive mode, pinned git entries on known hosting sites are
+    downloaded as source archives instead, see archive.fetch_archive.
+    """
+
+    def __init__(self, shallow=False, partial=False, cache=None, rewriter=None,
+                 archive=False):
+        """
+        :param shallow: default for entries not setting meta 'shallow'
+        :param partial: default for entries not setting meta 'partial'
+        :param cache: ReferenceCache or None
+        :param rewriter: UriRewriter or None
+        :param archive: default for entries not setting meta 'archive'
+        """
+        self.shallow = shallow
+        self.partial = partial
+        self.cache = cache
+        self.cached = 0
+        self.rewriter = rewriter
+        self.rewrite_failures = 0
+        self.archive = archive
+        # path: (archive url, top level directory) of archive checkouts
+        self.archives = {}
+        self._lock = threading.Lock()
+        self._shared = {}
+        self.reused = 0
+        self.saved_bytes = 0
+        self.saved_seconds = 0
+
+    def describe_rewrite(self, uri):
+        """
+        :returns: message about the rewrite rule applying to uri, or None
+        """
+        if self.rewriter is None:
+            return None
+        rewritten, rule = self.rewriter.rewrite(uri)
+        if rule is None:
+            return None
+        return "Fetching %s instead of %s (rewrite rule %s -> %s)" % (
+            rewritten, uri, rule[0], rule[1])
+
+    def checkout(self, scmtype, path, uri, version, verbose=False, timeout=None,
+                 tags=None):
+        """
+        Failed checkouts leave no partial directory behind, so that
+        they can be retried.
+
+        :param tags: tags of the entry, for its meta options
+        :returns: True on success
+        """
+        existed = os.path.exists(path)
+        success = self._checkout_any(scmtype, path, uri, version, verbose,
+                                     timeout, tags)
+        if not success and not existed and os.path.exists(path):
+            shutil.rmtree(path)
+        return success
+
+    def _checkout_any(self, scmtype, path, uri, version, verbose, timeout, tags):
+        if scmtype == 'git' and get_meta_options(tags).get('archive', self.archive):
+            archive_url = get_archive_url(uri, version)
+            if archive_url is not None:
+                try:
+                    top_dir = fetch_archive(archive_url, path, get_archive_cache_dir())
+                    with self._lock:
+                        self.archives[path] = (archive_url, top_dir)
+                    return True
+                except (EnvironmentError, tarfile.TarError):
+                    # fall back to cloning
+                    pass
+        if self.rewriter is not None:
+            rewritten, rule = self.rewriter.rewrite(uri)
+            if rule is not None:
+                if (self._checkout(scmtype, path, rewritten, version,
+                                   verbose, timeout, tags) and
+                        _set_remote_uri(scmtype, path, uri)):
+                    return True
+                with self._lock:
+                    self.rewrite_failures += 1
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+        return self._checkout(scmtype, path, uri, version, verbose, timeout, tags)
+
+    def _checkout(self, scmtype, path, uri, version, verbose, timeout, tags):
+        meta = get_meta_options(tags)
+        shallow = meta.get('shallow', self.shallow)
+        partial = meta.get('partial', self.partial)
+        vcs_client = vcstools.get_vcs_client(scmtype, path)
+        if scmtype == 'git' and (shallow or partial):
+            return self._clone_pinned(path, uri, version, shallow, partial,
+                                      verbose=verbose, timeout=timeout)
+        if scmtype == 'git' and self.cache is not None:
+            if self.cache.clone(uri, path, version):
+                with self._lock:
+                    self.cached += 1
+                return True
+        if scmtype != 'git' or not version:
+            return vcs_client.checkout(uri, version, verbose=verbose,
+                                       timeout=timeout, shallow=shallow)
+        with self._lock:
+            shared = self._shared.get(uri)
+            is_first = shared is None
+            if is_first:
+                shared = self._shared[uri] = _SharedClone()
+        if is_first:
+            start = time.time()
+            try:
+                success = vcs_client.checkout(uri, version,
+                                              verbose=verbose, timeout=timeout)
+                if success:
+                    shared.path = path
+                    shared.duration = time.time() - start
+                return success
+            finally:
+                shared.done.set()
+        shared.done.wait()
+        if shared.path is not None:
+            start = time.time()
+            if self._clone_local(shared.path, path, uri, version):
+                self._record_savings(shared, time.time() - start)
+                return True
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        return vcs_client.checkout(uri, version,
+                                   verbose=verbose, timeout=timeout)
+
+    def update(self, scmtype, path, version, verbose=False, timeout=None,
+               uri=None):
+        """
+        Update an existing checkout to version. Shallow git clones
+        fetch just the pinned version, so they keep working after a
+        tag or branch moved.
+
+        :param uri: the entry's URI, git objects are fetched from its
+          rewritten URI first, if any
+        :returns: True on success
+        """
+        vcs_client = vcstools.get_vcs_client(scmtype, path)
+        if (scmtype == 'git' and self.rewriter is not None and
+                not _is_shallow_git(path)):
+            rewritten, rule = self.rewriter.rewrite(uri)
+            if rule is not None:
+                if (_run_git(['fetch', '-q', rewritten,
+                              '+refs/heads/*:refs/remotes/origin/*',
+                              '+refs/tags/*:refs/tags/*'], cwd=path) and
+                        self._update_fetched(vcs_client, version, verbose, timeout)):
+                    return True
+                # update from origin instead
+                with self._lock:
+                    self.rewrite_failures += 1
+        if scmtype == 'git' and version and _is_shallow_git(path):
+            return self._update_shallow(path, version)
+        return vcs_client.update(version, verbose=verbose, timeout=timeout)
+
+    def _update_fetched(self, vcs_client, version, verbose, timeout):
+        """
+        Update a git checkout to version from what was fetched into its
+        origin remote branches, without contacting origin.
+
+        :returns: True on success
+        """
+        try:
+            return vcs_client._do_update(refname=version, verbose=verbose,
+                                         timeout=timeout)
+        except GitError:
+            return False
+
+    def _clone_pinned(self, path, uri, version, shallow, partial,
+                      verbose=False, timeout=None):
+        """
+        Clone only what the pinned version needs: shallow cuts the
+        history at depth 1, partial leaves out blobs until checkout.
+        Commit ids are fetched by id, which not all servers allow, so
+        a full clone is the last resort. git's error output is printed
+        if all attempts fail, or always if verbose.
+        """
+        errors = []
+
+        def git(args, cwd=None):
+            success, stderr = _call_git(args, cwd=cwd, timeout=timeout)
+            if stderr and (verbose or not success):
+                errors.append("git %s:\n%s" % (' '.join(args), stderr))
+            return success
+
+        def clear():
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+        fetch_args = []
+        if shallow:
+            fetch_args += ['--depth', '1']
+        if partial:
+            fetch_args.append('--filter=blob:none')
+        if not version:
+            success = git(['clone', '-q'] + fetch_args + [uri, path])
+        else:
+            # --branch accepts branch and tag names
+            success = git(['clone', '-q'] + fetch_args +
+                          ['--branch', version, uri, path])
+            if not success:
+                # maybe a commit id, fetch just that
+                clear()
+                success = (git(['init', '-q', path]) and
+                           git(['remote', 'add', 'origin', uri], cwd=path) and
+                           git(['fetch', '-q'] + fetch_args + ['origin', version],
+                               cwd=path) and
+                           git(['checkout', '-q', 'FETCH_HEAD'], cwd=path))
+            if not success:
+                # the server does not allow fetching commit ids
+                clear()
+                success = (git(['clone', '-q', uri, path]) and
+                           git(['checkout', '-q', version], cwd=path))
+                shallow = False
+        submodule_args = ['submodule', 'update', '--init', '--recursive']
+        if shallow:
+            submodule_args += ['--depth', '1']
+        success = success and git(submodule_args, cwd=path)
+        if errors and (verbose or not success):
+            print('\n'.join(errors), file=sys.stderr)
+        return success
+
+    def fetch(self, scmtype, path, version=None, uri=None):
+        """
+        Download what updating the checkout at path needs from remote,
+        without touching its working tree, so that a later update
+        finds all objects locally. git objects are fetched via the
+        reference cache or the rewritten URI of uri, if any.
+
+        :returns: True on success, None if the SCM cannot fetch
+          without updating
+        """
+        if scmtype == 'hg':
+            return subprocess.call(['hg', 'pull', '-q'], cwd=path) == 0
+        if scmtype != 'git':
+            return None
+        if version and _is_shallow_git(path):
+            return self._fetch_shallow(path, version) is not None
+        sources = ['origin']
+        if uri and self.cache is not None and self.cache.update_mirror(uri):
+            sources.insert(0, self.cache.get_mirror_path(uri))
+        elif uri and self.rewriter is not None:
+            rewritten, rule = self.rewriter.rewrite(uri)
+            if rule is not None:
+                sources.insert(0, rewritten)
+        for source in sources:
+            if _run_git(['fetch', '-q', source,
+                         '+refs/heads/*:refs/remotes/origin/*',
+                         '+refs/tags/*:refs/tags/*'], cwd=path):
+                return True
+        return False
+
+    def _fetch_shallow(self, path, version):
+        """
+        Fetch version at depth 1 as a tag, a branch or a commit id.
+
+        :returns: the ref to check out, None if the fetch failed
+        """
+        if _run_git(['fetch', '-q', '--depth', '1', 'origin',
+                     '+refs/tags/%s:refs/tags/%s' % (version, version)], cwd=path):
+            return 'refs/tags/%s' % version
+        if _run_git(['fetch', '-q', '--depth', '1', 'origin',
+                     '+refs/heads/%s:refs/remotes/origin/%s' % (version, version)],
+                    cwd=path):
+            return 'refs/remotes/origin/%s' % version
+        if _run_git(['fetch', '-q', '--depth', '1', 'origin', version], cwd=path):
+            return 'FETCH_HEAD'
+        return None
+
+    def _update_shallow(self, path, version):
+        """
+        Fetch version at depth 1 as a tag, a branch or a commit id, and
+        check it out.
+        """
+        ref = self._fetch_shallow(path, version)
+        if ref is None:
+            return False
+        if ref.startswith('refs/remotes/'):
+            # reset, a shallow history cannot be merged with the moved branch
+            success = _run_git(['checkout', '-q', '-B', version, ref], cwd=path)
+        else:
+            success = _run_git(['checkout', '-q', ref], cwd=path)
+        return success and _run_git(['submodule', 'update', '--init', '--recursive',
+                                     '--depth', '1'], cwd=path)
+
+    def _clone_local(self, source_path, path, uri, version):
+        """
+        Clone from a local checkout of the same remote repository,
+        hardlinking its objects, so that no network access is needed.
+        """
+        # the fetch runs in path
+        source_path = os.path.abspath(source_path)
+        if not _run_git(['clone', '--no-checkout', source_path, path]):
+            return False
+        # the source's remote branches become ours, tags are cloned anyway
+        return (_run_git(['remote', 'set-url', 'origin', uri], cwd=path) and
+                _run_git(['fetch', source_path,
+                          '+refs/remotes/origin/*:refs/remotes/origin/*'], cwd=path) and
+                _run_git(['checkout', '-q', version], cwd=path) and
+                _run_git(['submodule', 'update', '--init', '--recursive'], cwd=path))
+
+    def _record_savings(self, shared, duration):
+        with self._lock:
+            if shared.size is None:
+                shared.size = _get_dir_size(os.path.join(shared.path, '.git'))
+            self.reused += 1
+            self.saved_bytes += shared.size
+            self.saved_seconds += max(0, shared.duration - duration)
+
+    def finish(self):
+        """
+        Called once all checkouts are done, prunes the reference cache.
+        """
+        if self.cache is not None:
+            self.cache.prune()
+
+    def get_summary(self):
+        """
+        :returns: message about fetches saved by reusing local clones, or None
+        """
+        lines = []
+        if self.reused:
+            lines.append("Reused local clones for %s checkouts of shared repositories, "
+                         "saving about %.1f MiB of downloads and %.1f s." %
+                         (self.reused, self.saved_bytes / (1024.0 * 1024.0),
+                          self.saved_seconds))
+        if self.cached:
+            lines.append("Cloned %s checkouts from the reference cache in %s." %
+                         (self.cached, self.cache.path))
+        if self.archives:
+            lines.append("Downloaded source archives for %s checkouts instead of cloning." %
+                         len(self.archives))
+        if self.rewrite_failures:
+            lines.append("Fetching from rewritten URIs failed %s times, "
+                         "used the original URIs instead." % self.rewrite_failures)
+        return '\n'.join(lines) or None
+
+
+# output buffer of the current thread while captured_output() is active
+_capture = threading.local()
+_capture_lock = threading.Lock()
+_VCSTOOLS_CLIENT_MODULES = ['git', 'hg', 'svn', 'bzr', 'tar']
+
+
+class _ThreadStream(object):
+    """
+    Stands in for sys.stdout or sys.stderr: writes of threads capturing
+    their output go to their buffer, all others to stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buf = getattr(_capture, 'buf', None)
+        if buf is None:
+            self.stream.write(text)
+        else:
+            buf.append(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _get_capturing_run(run_shell_command):
+    """
+    :returns: vcstools' run_shell_command, except that in threads
+      capturing their output, SCM processes get pipes instead of the
+      terminal, and their output that would have been shown goes to
+      the buffer of the thread
+    """
+    def run(cmd, **kwargs):
+        buf = getattr(_capture, 'buf', None)
+        if buf is None:
+            return run_shell_command(cmd, **kwargs)
+        if kwargs.get('no_filter'):
+            # stdout and stderr would have gone to the terminal
+            kwargs.update(no_filter=False, show_stdout=False, verbose=False, no_warn=True)
+            value, stdout, message = run_shell_command(cmd, **kwargs)
+            for text in [stdout, message]:
+                if text:
+                    buf.append(text + '\n')
+            # as without filter, callers must not log stderr again
+            return value, None, None
+        shown = kwargs.get('show_stdout') or kwargs.get('verbose')
+        kwargs.update(show_stdout=False, verbose=False)
+        value, stdout, message = run_shell_command(cmd, **kwargs)
+        if shown and stdout:
+            buf.append(stdout + '\n')
+        return value, stdout, message
+    run.captures = True
+    return run
+
+
+@contextmanager
+def _thread_streams(enabled=True):
+    """
+    Installs _ThreadStream as sys.stdout and sys.stderr, also for the
+    vcstools log handler.
+    """
+    if not enabled:
+        yield
+        return
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _ThreadStream(stdout), _ThreadStream(stderr)
+    handlers = [handler for handler in logging.getLogger('vcstools').handlers
+                if getattr(handler, 'stream', None) in [stdout, stderr]]
+    for handler in handlers:
+        handler.stream = _ThreadStream(handler.stream)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        for handler in handlers:
+            handler.stream = handler.stream.stream
+
+
+def _install_output_capture():
+    with _capture_lock:
+        for name in _VCSTOOLS_CLIENT_MODULES:
+            module = getattr(vcstools, name, None)
+            run_shell_command = getattr(module, 'run_shell_command', None)
+            if run_shell_command is not None and not getattr(run_shell_command, 'captures', False):
+                module.run_shell_command = _get_capturing_run(run_shell_command)
+
+
+@contextmanager
+def captured_output(enabled=True):
+    """
+    Buffers what SCM commands and vcstools print in this thread, for
+    printing it as a group once an entry is done. Needs
+    _install_output_capture() and _ThreadStream as sys.stdout and
+    sys.stderr.
+
+    :returns: context manager yielding the list of captured texts,
+      None if not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    _capture.buf = []
+    try:
+        yield _capture.buf
+    finally:
+        _capture.buf = None
+
+
+def _checkout_entry(frag, session, verbose=False, inactivity_timeout=None,
+                    entry_timeout=None, retries=DEFAULT_RETRIES, capture=False):
+    """
+    Check out a single rosinstall entry.
+
+    :param capture: buffer the SCM output, to print it with the lines
+    :returns: (path_spec, list of output lines)
+    :raises: MultiProjectException if the checkout failed, with the
+      captured SCM output
+    """
+    path_spec = get_path_spec_from_yaml(frag)
+    # the watchdog finds SCM processes by absolute path
+    path = os.path.abspath(path_spec.get_path())
+    lines = []
+    rewrite = session.describe_rewrite(path_spec.get_uri())
+    if verbose and rewrite:
+        lines.append("[%s] %s" % (path_spec.get_path(), rewrite))
+
+    def checkout():
+        if not session.checkout(path_spec.get_scmtype(),
+                                path,
+                                path_spec.get_uri(),
+                                path_spec.get_version(),
+                                tags=path_spec.get_tags()):
+            raise MultiProjectException(
+                "Checkout of %s version %s into %s failed." % (
+                    path_spec.get_uri(),
+                    path_spec.get_version(),
+                    path_spec.get_path()))
+    with captured_output(capture) as output:
+        try:
+            run_with_timeouts(checkout, path_spec.get_path(), path,
+                              inactivity_timeout=inactivity_timeout,
+                              total_timeout=entry_timeout,
+                              retries=retries)
+        except MultiProjectException as mpe:
+            if output:
+                raise MultiProjectException("%s\n%s" % (mpe, ''.join(output).rstrip()))
+            raise
+    if output:
+        lines.append(''.join(output).rstrip())
+    lines.append("[%s] Done." % path_spec.get_path())
+    return path_spec, lines
+
 
-def checkout_rosinstall(rosinstall_data, verbose=False):
+def checkout_rosinstall(rosinstall_data, verbose=False, num_threads=1,
+                        shallow=False, partial=False, cache=None, rewriter=None,
+                        archive=False, inactivity_timeout=None,
+                        entry_timeout=None, retries=DEFAULT_RETRIES):
     """
-    :param rosinstall_data: yaml dict in rosinstall format
+    :param rosinstall_data: yaml dict in rosinstall format, or any
+      iterable of entries such as iter_rosinstall_yaml(), entries are
+      dispatched to checkout as they become available
+    :param num_threads: how many entries to check out in parallel, the
+      output of each entry including that of its SCM commands is
+      printed as a group once it is done
+    :param shallow: clone only the pinned version, without history
+    :param partial: clone git repositories without blobs, fetching
+      file contents on demand
+    :param cache: reference_cache.ReferenceCache to clone git entries from
+    :param rewriter: uri_rewrite.UriRewriter for fetching from mirrors
+    :param archive: download source archives for pinned git entries
+      where possible
+    :param inactivity_timeout: see watchdog.run_with_timeouts
+    :param entry_timeout: total_timeout of watchdog.run_with_timeouts
+    :param retries: see watchdog.run_with_timeouts
+    :returns: the number of entries processed
     :raises: rosinstall.common.MultiProjectException for incvalid yaml
+      or if any checkout failed, after all entries have been processed
     """
-    for frag in rosinstall_data:
-        path_spec = get_path_spec_from_yaml(frag)
-        if verbose:
-            print(path_spec.get_scmtype(),
-                  path_spec.get_path(),
-                  path_spec.get_uri(),
-                  path_spec.get_version())
-
-        vcs_client = vcstools.get_vcs_client(path_spec.get_scmtype(),
-                                             path_spec.get_path())
-        vcs_client.checkout(path_spec.get_uri(),
-                            path_spec.get_version())
+    failures = []
+    count = 0
+    session = CheckoutSession(shallow=shallow, partial=partial, cache=cache,
+                              rewriter=rewriter, archive=archive)
+    pool = WorkerPool(num_threads)
+    capture = pool.num_threads > 1
+    if capture:
+        _install_output_capture()
+    with _thread_streams(capture):
+        for frag, output, error in pool.imap(
+                lambda frag: _checkout_entry(frag, session, verbose,
+                                             inactivity_timeout=inactivity_timeout,
+                                             entry_timeout=entry_timeout,
+                                             retries=retries,
+                                             capture=capture),
+                rosinstall_data):
+            count += 1
+            if error is None:
+                path_spec, lines = output
+                if verbose:
+                    print(path_spec.get_scmtype(),
+                          path_spec.get_path(),
+                          path_spec.get_uri(),
+                          path_spec.get_version())
+                print('\n'.join(lines))
+            else:
+                print("Error checking out %s:\n  %s" % (frag, error))
+                failures.append((frag, error))
+    session.finish()
+    summary = session.get_summary()
+    if summary:
+        print(summary)
+    if failures:
+        summary = "%s of the entries failed to check out:\n" % len(failures)
+        for frag, error in failures:
+            summary += "  %s: %s\n" % (frag, error)
+        raise MultiProjectException(summary)
+    return count
@@ -0,0 +1,100 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+URI prefix rewrite rules, e.g. to fetch from LAN mirrors of upstream
+hosts. Rules only apply when fetching, config files keep the original
+URIs. The rules file is a yaml list::
+
+  - from: https://github.com/
+    to: http://mirror.example.lan/github/
+
+The longest matching 'from' prefix wins.
+"""
+
+import os
+import yaml
+
+from wstool.common import MultiProjectException
+
+REWRITE_RULES_ENV = 'ROSINSTALL_REWRITE_RULES'
+DEFAULT_REWRITE_RULES = os.path.join('~', '.ros', 'rosinstall', 'rewrite_rules.yaml')
+
+
+class UriRewriter(object):
+
+    def __init__(self, rules):
+        """
+        :param rules: list of (from_prefix, to_prefix)
+        """
+        # longest prefix first
+        self.rules = sorted(rules, key=lambda rule: len(rule[0]), reverse=True)
+
+    def rewrite(self, uri):
+        """
+        :returns: (rewritten uri, (from_prefix, to_prefix)), or
+          (uri, None) if no rule matches
+        """
+        if uri:
+            for rule in self.rules:
+                if uri.startswith(rule[0]):
+                    return rule[1] + uri[len(rule[0]):], rule
+        return uri, None
+
+
+def load_rewrite_rules(path=None):
+    """
+    :param path: rules file, defaults to $ROSINSTALL_REWRITE_RULES or
+      ~/.ros/rosinstall/rewrite_rules.yaml
+    :returns: UriRewriter, or None if there is no rules file
+    :raises: MultiProjectException for invalid rules files
+    """
+    if path is None:
+        path = os.environ.get(REWRITE_RULES_ENV, DEFAULT_REWRITE_RULES)
+    path = os.path.expanduser(path)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as rules_file:
+        try:
+            data = yaml.safe_load(rules_file)
+        except yaml.YAMLError as yame:
+            raise MultiProjectException("Invalid yaml in %s: %s" % (path, yame))
+    rules = []
+    for rule in data or []:
+        if (type(rule) != dict or
+                not rule.get('from') or
+                rule.get('to') is None):
+            raise MultiProjectException(
+                "Invalid rewrite rule in %s, need 'from' and 'to': %s" % (path, rule))
+        rules.append((str(rule['from']), str(rule['to'])))
+    return UriRewriter(rules)
@@ -0,0 +1,318 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2011, Willow Garage, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Willow Garage, Inc. nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Per-entry timeouts for checkouts and updates. While an entry is being
+installed, a watchdog thread observes the SCM processes working on its
+path. Once they made no progress for too long, or the entry ran for
+too long in total, the watchdog kills their process tree, so that a
+credential prompt or a stalled connection cannot block a whole run.
+Timed out entries are retried with backoff.
+
+Processes are told apart by their working directory or command line
+argument being the path of the entry, and include their children,
+e.g. git-remote-https of a git clone. Progress is CPU time of those
+processes or growth of the SCM metadata directory of the path.
+"""
+
+from __future__ import print_function
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from wstool.common import MultiProjectException
+
+DEFAULT_RETRIES = 2
+# seconds before the first retry, doubled for each further retry
+RETRY_BACKOFF = 5
+# seconds between SIGTERM and SIGKILL
+KILL_GRACE = 5
+
+_META_DIRS = ['.git', '.hg', '.bzr', '.svn']
+# left behind by git processes killed with SIGKILL
+_GIT_LOCK_FILES = ['index.lock', 'shallow.lock', 'HEAD.lock']
+
+
+def _parse_cpu_time(text):
+    """
+    :param text: cpu time as printed by ps, [[dd-]hh:]mm:ss
+    :returns: seconds
+    """
+    days = 0
+    if '-' in text:
+        days, text = text.split('-', 1)
+    seconds = 0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return int(days) * 86400 + seconds
+
+
+def _list_proc_processes():
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    processes = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            with open('/proc/%d/stat' % pid) as stat_file:
+                stat = stat_file.read()
+            with open('/proc/%d/cmdline' % pid, 'rb') as cmdline_file:
+                cmdline = cmdline_file.read().decode('utf-8', 'replace')
+            cwd = os.readlink('/proc/%d/cwd' % pid)
+        except (IOError, OSError):
+            # gone meanwhile, or not ours
+            continue
+        # the command name in parentheses may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        processes[pid] = (int(fields[1]),
+                          (int(fields[11]) + int(fields[12])) / ticks,
+                          [arg for arg in cmdline.split('\0') if arg],
+                          cwd)
+    return processes
+
+
+def _list_ps_processes():
+    output = subprocess.check_output(
+        ['ps', '-A', '-o', 'pid=', '-o', 'ppid=', '-o', 'time=', '-o', 'args='])
+    processes = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        fields = line.split(None, 3)
+        if len(fields) < 3:
+            continue
+        processes[int(fields[0])] = (int(fields[1]),
+                                     _parse_cpu_time(fields[2]),
+                                     fields[3].split() if len(fields) > 3 else [],
+                                     None)
+    return processes
+
+
+def list_processes():
+    """
+    :returns: dict of pid to (parent pid, cpu seconds, list of
+      arguments, working directory or None where unknown)
+    """
+    if os.path.isdir('/proc/self'):
+        return _list_proc_processes()
+    return _list_ps_processes()
+
+
+def find_entry_processes(path, processes=None):
+    """
+    :param processes: result of list_processes()
+    :returns: set of pids of descendants of this process working on
+      path, and of their descendants
+    """
+    if processes is None:
+        processes = list_processes()
+    path = os.path.abspath(path)
+    children = {}
+    for pid, (ppid, _, _, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+    # descendants of this process only, never those of other users
+    descendants = []
+    todo = list(children.get(os.getpid(), []))
+    while todo:
+        pid = todo.pop()
+        descendants.append(pid)
+        todo.extend(children.get(pid, []))
+    found = set()
+    for pid in descendants:
+        if pid in found:
+            continue
+        _, _, args, cwd = processes[pid]
+        if cwd != path and path not in args:
+            # relative arguments, e.g. of 'git clone <uri> <local-name>'
+            if cwd is None or path not in [os.path.normpath(os.path.join(cwd, arg))
+                                           for arg in args]:
+                continue
+        todo = [pid]
+        while todo:
+            pid = todo.pop()
+            found.add(pid)
+            todo.extend(children.get(pid, []))
+    return found
+
+
+def kill_processes(pids, grace=KILL_GRACE):
+    """
+    Terminates pids, and kills those still running after grace seconds.
+    """
+    for sig in [signal.SIGTERM, getattr(signal, 'SIGKILL', signal.SIGTERM)]:
+        alive = []
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+                alive.append(pid)
+            except OSError:
+                pass
+        deadline = time.time() + grace
+        while alive and time.time() < deadline:
+            time.sleep(0.1)
+            alive = [pid for pid in alive if _is_running(pid)]
+        pids = alive
+        if not pids:
+            return
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _get_meta_size(path):
+    size = 0
+    for meta_dir in _META_DIRS:
+        for root, _, files in os.walk(os.path.join(path, meta_dir)):
+            for filename in files:
+                try:
+                    size += os.lstat(os.path.join(root, filename)).st_size
+                except OSError:
+                    # e.g. temporary files renamed meanwhile
+                    pass
+    return size
+
+
+class EntryWatchdog(object):
+    """
+    Watches the installation of one entry from a background thread,
+    used as context manager around it. Kills the processes working on
+    path once they made no progress for inactivity_timeout seconds, or
+    after total_timeout seconds. expired then is the reason.
+    """
+
+    def __init__(self, path, inactivity_timeout=None, total_timeout=None,
+                 interval=None):
+        """
+        :param interval: seconds between checks, defaults to a fraction
+          of the shortest timeout
+        """
+        self.path = os.path.abspath(path)
+        self.inactivity_timeout = inactivity_timeout
+        self.total_timeout = total_timeout
+        if interval is None:
+            shortest = min([timeout for timeout in [inactivity_timeout, total_timeout]
+                            if timeout])
+            interval = min(max(shortest / 4.0, 0.5), 15)
+        self.interval = interval
+        self.expired = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._watch,
+                                        name='watchdog-%s' % os.path.basename(self.path))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._thread.join()
+
+    def _get_progress(self):
+        processes = list_processes()
+        pids = find_entry_processes(self.path, processes)
+        cpu = sum([processes[pid][1] for pid in pids])
+        return pids, (cpu, _get_meta_size(self.path))
+
+    def _watch(self):
+        start = last_progress_time = time.time()
+        last_progress = None
+        while not self._stopped.wait(self.interval):
+            now = time.time()
+            pids, progress = self._get_progress()
+            if progress != last_progress:
+                last_progress = progress
+                last_progress_time = now
+            if self.total_timeout and now - start > self.total_timeout:
+                self.expired = "Timed out after %d seconds" % self.total_timeout
+            elif (self.inactivity_timeout and
+                  now - last_progress_time > self.inactivity_timeout):
+                self.expired = "No progress for %d seconds" % self.inactivity_timeout
+            else:
+                continue
+            self._kill(pids)
+            return
+
+    def _kill(self, pids):
+        kill_processes(pids)
+        for lock_file in _GIT_LOCK_FILES:
+            lock_path = os.path.join(self.path, '.git', lock_file)
+            if os.path.exists(lock_path):
+                os.remove(lock_path)
+
+
+def run_with_timeouts(func, name, path, inactivity_timeout=None,
+                      total_timeout=None, retries=DEFAULT_RETRIES,
+                      backoff=RETRY_BACKOFF):
+    """
+    Calls func under an EntryWatchdog, and again after backoff seconds,
+    doubled each time, while it fails because the watchdog expired.
+
+    :param func: installs the entry at path, raises on failure
+    :param name: of the entry, for messages
+    :param inactivity_timeout: seconds without progress after which the
+      SCM processes working on path are killed and func is retried,
+      None to never kill them
+    :param total_timeout: same for the total duration of one attempt
+    :param retries: how often to retry after a timeout
+    :returns: result of func
+    :raises: MultiProjectException once retries are exhausted, other
+      errors of func unchanged
+    """
+    if not inactivity_timeout and not total_timeout:
+        return func()
+    attempt = 0
+    while True:
+        watchdog = EntryWatchdog(path, inactivity_timeout, total_timeout)
+        try:
+            with watchdog:
+                return func()
+        except Exception:
+            if watchdog.expired is None:
+                raise
+        attempt += 1
+        if attempt > retries:
+            raise MultiProjectException(
+                "[%s] %s, giving up after %d attempts" % (name, watchdog.expired, attempt))
+        delay = backoff * 2 ** (attempt - 1)
+        print("[%s] %s, killed its SCM processes, retrying in %d seconds" %
+              (name, watchdog.expired, delay))
+        time.sleep(delay)
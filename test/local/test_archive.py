@@ -0,0 +1,75 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from wstool import multiproject_cmd
+from wstool.config_yaml import PathSpec
+
+from rosinstall.archive import fetch_archive, get_archive_url, get_archive_checkout
+from rosinstall.rosinstall_cmd import _use_archive_element
+
+
+class ArchiveUrlTest(unittest.TestCase):
+
+    def test_get_archive_url(self):
+        self.assertEqual('https://github.com/ros/ros_comm/archive/1.9.41.tar.gz',
+                         get_archive_url('https://github.com/ros/ros_comm.git', '1.9.41'))
+        self.assertEqual('https://github.com/ros/ros_comm/archive/1.9.41.tar.gz',
+                         get_archive_url('git@github.com:ros/ros_comm.git', '1.9.41'))
+        self.assertEqual('https://gitlab.com/foo/bar/-/archive/v1/bar-v1.tar.gz',
+                         get_archive_url('https://gitlab.com/foo/bar.git', 'v1'))
+        self.assertEqual(None, get_archive_url('https://example.com/foo.git', '1.0'))
+        self.assertEqual(None, get_archive_url('https://github.com/ros/ros_comm.git', None))
+
+
+class FetchArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        src_path = os.path.join(self.test_root_path, 'src', 'foo-1.0.0')
+        os.makedirs(os.path.join(src_path, 'sub'))
+        subprocess.check_call(["touch", "sub/fixed.txt"], cwd=src_path)
+        self.tar_path = os.path.join(self.test_root_path, 'foo-1.0.0.tar.gz')
+        subprocess.check_call(["tar", "-czf", self.tar_path, 'foo-1.0.0'],
+                              cwd=os.path.dirname(src_path))
+        self.cache_dir = os.path.join(self.test_root_path, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_fetch_and_cache(self):
+        url = 'file://' + self.tar_path
+        path = os.path.join(self.test_root_path, 'ws', 'foo')
+        self.assertEqual('foo-1.0.0', fetch_archive(url, path, self.cache_dir))
+        self.assertTrue(os.path.isfile(os.path.join(path, 'sub', 'fixed.txt')))
+        self.assertEqual((url, 'foo-1.0.0'), get_archive_checkout(path))
+        # served from the cache once the download is gone
+        os.remove(self.tar_path)
+        path2 = os.path.join(self.test_root_path, 'ws', 'foo2')
+        self.assertEqual('foo-1.0.0', fetch_archive(url, path2, self.cache_dir))
+        self.assertTrue(os.path.isfile(os.path.join(path2, 'sub', 'fixed.txt')))
+
+    def test_fetch_failure_cleans_up(self):
+        path = os.path.join(self.test_root_path, 'ws', 'missing')
+        self.assertRaises(EnvironmentError, fetch_archive,
+                          'file://' + self.tar_path + '.missing', path, self.cache_dir)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_recorded_as_tar_element(self):
+        uri = 'https://github.com/ros/foo.git'
+        ws_path = os.path.join(self.test_root_path, 'ws')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        config.add_path_spec(PathSpec('foo', 'git', uri, '1.0.0'))
+        element = config.get_config_elements()[0]
+        self.assertTrue(element is _use_archive_element(config, element))
+        path = os.path.join(ws_path, 'foo')
+        fetch_archive('file://' + self.tar_path, path)
+        with open(os.path.join(path, '.tar'), 'w') as metadata:
+            metadata.write("{url: '%s', version: foo-1.0.0}" % get_archive_url(uri, '1.0.0'))
+        tar_element = _use_archive_element(config, element)
+        self.assertEqual('tar', tar_element.get_path_spec().get_scmtype())
+        self.assertEqual('foo-1.0.0', tar_element.get_path_spec().get_version())
+        self.assertEqual(1, len(config.get_config_elements()))
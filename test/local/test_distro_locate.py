@@ -0,0 +1,106 @@
+import unittest
+import rosinstall.distro_locate as distro_locate
+
+
+def _package_xml(name, depends=()):
+    return """<package>
+  <name>%s</name>
+  <version>0.1.0</version>
+  <description>test</description>
+  <maintainer email="foo@example.com">foo</maintainer>
+  <license>BSD</license>
+%s
+</package>""" % (name, '\n'.join(['  <run_depend>%s</run_depend>' % dep
+                                   for dep in depends]))
+
+
+class FakePackage():
+    def __init__(self, repository_name):
+        self.repository_name = repository_name
+
+
+class FakeReleaseRepository():
+    def __init__(self, url, package_names):
+        self.url = url
+        self.package_names = package_names
+        self.release_repository = self
+
+    def get_release_tag(self, pkg_name):
+        return 'release/%s/1.0.0' % pkg_name
+
+
+class FakeDistribution():
+    def __init__(self, name, repos, xmls):
+        self.name = name
+        self.repositories = {}
+        self.release_packages = {}
+        for repo_name, (url, packages) in repos.items():
+            self.repositories[repo_name] = FakeReleaseRepository(url, packages)
+            for pkg in packages:
+                self.release_packages[pkg] = FakePackage(repo_name)
+        self.xmls = xmls
+        self.fetched = []
+
+    def get_release_package_xml(self, pkg_name):
+        self.fetched.append(pkg_name)
+        return self.xmls[pkg_name]
+
+
+class DistroLocateTest(unittest.TestCase):
+
+    def setUp(self):
+        distro_locate._release_deps_cache.clear()
+        self.distribution = FakeDistribution(
+            'testdistro',
+            {'core': ('https://example.com/core.git', ['base', 'util']),
+             'app': ('https://example.com/app.git', ['app'])},
+            {'app': _package_xml('app', ['util', 'libfoo-dev']),
+             'util': _package_xml('util', ['base']),
+             'base': _package_xml('base')})
+
+    def test_dependency_closure(self):
+        closure = distro_locate.get_release_dependency_closure(
+            self.distribution, ['app'], num_threads=2)
+        self.assertEqual(set(['app', 'util', 'base']), closure)
+        # memoized, no second fetch
+        distro_locate.get_release_dependency_closure(
+            self.distribution, ['app'])
+        self.assertEqual(3, len(self.distribution.fetched))
+
+    def test_build_release_closure_rosinstall(self):
+        rosinstall = distro_locate.build_release_closure_rosinstall(
+            self.distribution, set(['util', 'app', 'base']), 'src')
+        self.assertEqual(
+            [{'git': {'local-name': 'src/app/app',
+                      'uri': 'https://example.com/app.git',
+                      'version': 'release/app/1.0.0'}},
+             {'git': {'local-name': 'src/core/base',
+                      'uri': 'https://example.com/core.git',
+                      'version': 'release/base/1.0.0'}},
+             {'git': {'local-name': 'src/core/util',
+                      'uri': 'https://example.com/core.git',
+                      'version': 'release/util/1.0.0'}}],
+            rosinstall)
+
+    def test_diff_release_indexes(self):
+        old_index = {'same': ('uri_s', '1.0.0-0'),
+                     'gone': ('uri_g', '0.1.0-0'),
+                     'bumped': ('uri_b', '1.0.0-0'),
+                     'moved': ('uri_m', '2.0.0-0')}
+        new_index = {'same': ('uri_s', '1.0.0-0'),
+                     'new': ('uri_n', '0.0.1-0'),
+                     'bumped': ('uri_b', '1.1.0-0'),
+                     'moved': ('uri_m2', '2.0.0-0')}
+        added, removed, changed = distro_locate.diff_release_indexes(
+            old_index, new_index)
+        self.assertEqual({'new': ('uri_n', '0.0.1-0')}, added)
+        self.assertEqual({'gone': ('uri_g', '0.1.0-0')}, removed)
+        self.assertEqual({'bumped': (('uri_b', '1.0.0-0'), ('uri_b', '1.1.0-0')),
+                          'moved': (('uri_m', '2.0.0-0'), ('uri_m2', '2.0.0-0'))},
+                         changed)
+
+    def test_index_release_repositories(self):
+        self.distribution.repositories['core'].version = '1.0.0-0'
+        self.distribution.repositories['app'].version = None
+        self.assertEqual({'core': ('https://example.com/core.git', '1.0.0-0')},
+                         distro_locate.index_release_repositories(self.distribution))
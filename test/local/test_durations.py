@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rosinstall.durations import DurationHistory
+
+
+class DurationHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_estimates(self):
+        history = DurationHistory(self.test_root_path)
+        # no history at all
+        self.assertEqual(30.0, history.get_estimate('foo', 'uri_foo', 'checkout'))
+        history.record('big', 'uri_big', 'checkout', 100.0)
+        history.record('small', 'uri_small', 'checkout', 10.0)
+        history.record('small', 'uri_small', 'checkout', 20.0)
+        history.save()
+        history = DurationHistory(self.test_root_path)
+        # smoothed over runs
+        self.assertEqual(15.0, history.get_estimate('small', 'uri_small', 'checkout'))
+        # median of known entries for new ones and changed uris
+        self.assertEqual(57.5, history.get_estimate('foo', 'uri_foo', 'checkout'))
+        self.assertEqual(57.5, history.get_estimate('big', 'uri_moved', 'checkout'))
+        self.assertEqual(5.0, history.get_estimate('big', 'uri_big', 'update'))
+
+    def test_broken_file(self):
+        with open(os.path.join(self.test_root_path, '.rosinstall.durations'), 'w') as fhand:
+            fhand.write('{broken')
+        self.assertEqual({}, DurationHistory(self.test_root_path).entries)
+
+    def test_invalid_entries(self):
+        with open(os.path.join(self.test_root_path, '.rosinstall.durations'), 'w') as fhand:
+            fhand.write('{"foo": [1], "bar": {"uri": "uri_bar", "checkout": "slow", "update": 2},'
+                        ' "baz": {"uri": "uri_baz", "checkout": true}}')
+        history = DurationHistory(self.test_root_path)
+        self.assertEqual({'bar': {'uri': 'uri_bar', 'update': 2},
+                          'baz': {'uri': 'uri_baz'}}, history.entries)
+        self.assertEqual(30.0, history.get_estimate('bar', 'uri_bar', 'checkout'))
+        self.assertEqual(2, history.get_estimate('foo', 'uri_foo', 'update'))
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wstool.common import MultiProjectException
+from rosinstall.host_limits import load_host_limits
+
+
+class LoadHostLimitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.limits_path = os.path.join(self.test_root_path, 'host_limits.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_load(self):
+        self.assertEqual({}, load_host_limits(self.limits_path))
+        with open(self.limits_path, 'w') as fhand:
+            fhand.write('GitHub.com: 8\ngit.example.lan: 2\n')
+        self.assertEqual({'github.com': 8, 'git.example.lan': 2},
+                         load_host_limits(self.limits_path))
+
+    def test_invalid(self):
+        with open(self.limits_path, 'w') as fhand:
+            fhand.write('github.com: 0\n')
+        self.assertRaises(MultiProjectException, load_host_limits, self.limits_path)
+        with open(self.limits_path, 'w') as fhand:
+            fhand.write('- github.com\n')
+        self.assertRaises(MultiProjectException, load_host_limits, self.limits_path)
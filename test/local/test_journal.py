@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from wstool import multiproject_cmd
+from wstool.config_yaml import PathSpec
+
+from rosinstall.journal import InstallJournal
+from rosinstall.rosinstall_cmd import cmd_install_or_update
+from test.io_wrapper import StringIO
+from test.scm_test_base import _create_git_repo
+
+
+class InstallJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.git_path = os.path.join(self.test_root_path, "gitrepo")
+        _create_git_repo(self.git_path)
+        self.ws_path = os.path.join(self.test_root_path, "ws")
+        self.config = multiproject_cmd.get_config(self.ws_path, additional_uris=[],
+                                                  config_filename=None)
+        for name in ['foo', 'bar']:
+            self.config.add_path_spec(PathSpec(name, 'git', self.git_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def _install(self, **kwargs):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertTrue(cmd_install_or_update(self.config, **kwargs))
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_finished_run(self):
+        self._install()
+        journal = InstallJournal(self.ws_path)
+        self.assertTrue(os.path.isfile(journal.path))
+        self.assertEqual(None, journal.read_interrupted())
+        output = self._install(resume=True)
+        self.assertTrue('No interrupted run' in output, output)
+
+    def test_one_begin_per_checkout(self):
+        self._install()
+        with open(InstallJournal(self.ws_path).path) as journal_file:
+            records = [json.loads(line) for line in journal_file]
+        begins = [(record['local-name'], record['checkout'])
+                  for record in records if record['event'] == 'begin']
+        self.assertEqual([('bar', True), ('foo', True)], sorted(begins))
+
+    def test_resume_interrupted(self):
+        os.makedirs(os.path.join(self.ws_path, 'bar'))
+        shutil.copytree(self.git_path, os.path.join(self.ws_path, 'foo'))
+        foo, bar = self.config.get_config_elements()
+        # as left behind by a run killed while checking out bar
+        journal = InstallJournal(self.ws_path)
+        journal.start()
+        journal.begin(foo)
+        journal.done(foo)
+        journal.begin(bar, checkout=True)
+        journal.close()
+        completed, in_flight = journal.read_interrupted()
+        self.assertEqual(['foo'], list(completed.keys()))
+        self.assertTrue(completed['foo']['revision'])
+        self.assertEqual(['bar'], list(in_flight.keys()))
+
+        output = self._install(resume=True)
+        self.assertTrue('[foo] Completed by the interrupted run' in output, output)
+        self.assertTrue('[bar] Removed incomplete checkout' in output, output)
+        self.assertTrue(os.path.isfile(os.path.join(self.ws_path, 'bar', 'gitfixed.txt')))
+        self.assertEqual(None, journal.read_interrupted())
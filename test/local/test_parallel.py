@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+
+from wstool.common import MultiProjectException
+from rosinstall.parallel import AdaptiveLimiter, KeyLimiter, WorkerPool, parse_jobs
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_imap_keeps_order(self):
+        def job(item):
+            # later items finish first
+            time.sleep(0.01 * (5 - item))
+            if item == 3:
+                raise ValueError('bad item')
+            return item * 10
+        for num_threads in [1, 4]:
+            outputs = WorkerPool(num_threads).map(job, range(5))
+            self.assertEqual([0, 1, 2, 3, 4], [item for item, _, _ in outputs])
+            self.assertEqual([0, 10, 20, None, 40], [res for _, res, _ in outputs])
+            self.assertTrue(isinstance(outputs[3][2], ValueError))
+
+    def test_imap_input_error(self):
+        def items():
+            yield 1
+            yield 2
+            raise ValueError('broken input')
+        results = []
+        try:
+            for item, _, _ in WorkerPool(3).imap(lambda x: x, items()):
+                results.append(item)
+            self.fail('expected ValueError')
+        except ValueError:
+            pass
+        self.assertEqual([1, 2], results)
+
+    def test_imap_max_pending(self):
+        started = []
+
+        def job(item):
+            started.append(item)
+            return item
+        outputs = WorkerPool(4).imap(job, range(20), max_pending=2)
+        self.assertEqual(0, next(outputs)[0])
+        time.sleep(0.1)
+        # one consumed result plus at most two waiting ones
+        self.assertTrue(len(started) <= 3, started)
+        self.assertEqual(list(range(1, 20)), [item for item, _, _ in outputs])
+
+    def test_key_limiter(self):
+        lock = threading.Lock()
+        running = {}
+        most = {}
+
+        def job(item):
+            with lock:
+                running[item[0]] = running.get(item[0], 0) + 1
+                most[item[0]] = max(most.get(item[0], 0), running[item[0]])
+            time.sleep(0.05)
+            with lock:
+                running[item[0]] -= 1
+            return item
+        items = ['a1', 'a2', 'a3', 'a4', 'b1', 'b2', 'c1']
+        limiter = KeyLimiter(lambda item: item[0], limits={'a': 1}, default_limit=2)
+        outputs = WorkerPool(4, limiters=[limiter]).map(job, items)
+        # results stay in input order
+        self.assertEqual(items, [item for item, _, _ in outputs])
+        self.assertEqual({'a': 1, 'b': 2, 'c': 1}, most)
+        self.assertEqual({'a': 0, 'b': 0, 'c': 0}, limiter.running)
+
+    def test_adaptive_limiter(self):
+        now = [0.0]
+        limiter = AdaptiveLimiter(initial=2, maximum=4, clock=lambda: now[0])
+
+        def run_round(duration, error=None):
+            items = [object() for _ in range(limiter.level)]
+            for item in items:
+                self.assertTrue(limiter.can_start(item))
+                limiter.started(item)
+            self.assertFalse(limiter.can_start(object()))
+            now[0] += duration
+            for item in items:
+                limiter.finished(item, error)
+        run_round(1.0)
+        self.assertEqual(3, limiter.level)
+        # 3 jobs per second after 2, increase again
+        run_round(1.0)
+        self.assertEqual(4, limiter.level)
+        run_round(1.0)
+        self.assertEqual(4, limiter.level)
+        # jobs failing together halve the level once
+        run_round(1.0, error=IOError('connection reset'))
+        self.assertEqual(2, limiter.level)
+        run_round(1.0, error=IOError('connection reset'))
+        self.assertEqual(1, limiter.level)
+
+    def test_parse_jobs(self):
+        self.assertEqual(3, parse_jobs('3'))
+        self.assertEqual('auto', parse_jobs('auto'))
+        self.assertEqual(8, parse_jobs('Auto', 8))
+        self.assertEqual(1, parse_jobs(None))
+        self.assertEqual(8, parse_jobs(None, 8, default=8))
+        self.assertRaises(MultiProjectException, parse_jobs, '0')
+        self.assertRaises(MultiProjectException, parse_jobs, 'many')
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from rosinstall.profiling import RunProfile, get_uri_host
+from wstool.config_yaml import PathSpec
+from test.scm_test_base import _create_git_repo
+
+
+class FakeElement(object):
+
+    def __init__(self, path, spec):
+        self.path = path
+        self.spec = spec
+
+    def get_path(self):
+        return self.path
+
+    def get_local_name(self):
+        return self.spec.get_local_name()
+
+    def get_path_spec(self):
+        return self.spec
+
+
+class RunProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_get_uri_host(self):
+        self.assertEqual('github.com', get_uri_host('https://GitHub.com/ros/ros.git'))
+        self.assertEqual('github.com', get_uri_host('git@github.com:ros/ros.git'))
+        self.assertEqual('code.ros.org', get_uri_host('svn+ssh://user@code.ros.org:22/svn'))
+        self.assertEqual(None, get_uri_host('/tmp/repo'))
+
+    def test_write(self):
+        git_path = os.path.join(self.test_root_path, 'gitrepo')
+        _create_git_repo(git_path)
+        path = os.path.join(self.test_root_path, 'ws', 'repo')
+        element = FakeElement(path, PathSpec('repo', 'git', git_path))
+        profile = RunProfile('rosinstall', jobs=2)
+        with profile.phase('install'):
+            with profile.entry(element, 'checkout'):
+                subprocess.check_call(['git', 'clone', '-q', git_path, path])
+        try:
+            with profile.entry(element, 'update'):
+                raise ValueError('failed update')
+        except ValueError:
+            pass
+        profile_path = os.path.join(self.test_root_path, 'profile.json')
+        profile.write(profile_path)
+        with open(profile_path) as fhand:
+            data = json.load(fhand)
+        self.assertEqual('rosinstall-profile', data['format'])
+        self.assertEqual(1, data['version'])
+        self.assertEqual(2, data['jobs'])
+        self.assertEqual(['install'], [phase['name'] for phase in data['phases']])
+        self.assertTrue(data['phases'][0]['success'])
+        checkout, update = data['entries']
+        self.assertEqual(('repo', 'checkout', 'git', None),
+                         (checkout['localname'], checkout['action'],
+                          checkout['scmtype'], checkout['host']))
+        self.assertTrue(checkout['success'])
+        self.assertTrue(checkout['bytes'] > 0)
+        self.assertFalse(update['success'])
+        self.assertEqual(0, update['bytes'])
+        self.assertTrue(data['wall'] >= checkout['wall'] >= 0)
+
+    def test_write_trace(self):
+        element = FakeElement(os.path.join(self.test_root_path, 'repo'),
+                              PathSpec('repo', 'git', 'https://github.com/ros/ros.git'))
+        profile = RunProfile('rosws update')
+        with profile.phase('install'):
+            with profile.entry(element, 'update'):
+                pass
+        profile.begin_phase('bootstrap', track='rosmake bootstrap')
+        profile.end_phase('bootstrap')
+        trace_path = os.path.join(self.test_root_path, 'trace.json')
+        profile.write_trace(trace_path)
+        with open(trace_path) as fhand:
+            events = json.load(fhand)['traceEvents']
+        tracks = dict([(event['args']['name'], event['tid']) for event in events
+                       if event['name'] == 'thread_name'])
+        spans = dict([(event['name'], event) for event in events if event['ph'] == 'X'])
+        self.assertEqual(set(['install', 'repo', 'bootstrap']), set(spans.keys()))
+        self.assertEqual(spans['install']['tid'], spans['repo']['tid'])
+        self.assertEqual(tracks['rosmake bootstrap'], spans['bootstrap']['tid'])
+        self.assertNotEqual(spans['install']['tid'], spans['bootstrap']['tid'])
+        self.assertEqual('github.com', spans['repo']['args']['host'])
+        self.assertTrue(spans['install']['dur'] >= spans['repo']['dur'])
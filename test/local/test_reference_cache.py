@@ -0,0 +1,71 @@
+import fcntl
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from rosinstall.reference_cache import ReferenceCache, normalize_uri
+from rosinstall.simple_checkout import CheckoutSession
+from test.scm_test_base import _create_git_repo
+
+
+class NormalizeUriTest(unittest.TestCase):
+
+    def test_normalize_uri(self):
+        self.assertEqual('https://github.com/ros/ros',
+                         normalize_uri('https://user@GitHub.com/ros/ros.git/'))
+        self.assertEqual('ssh://github.com/ros/ros',
+                         normalize_uri('git@github.com:ros/ros.git'))
+        self.assertEqual('/tmp/foo', normalize_uri('/tmp/foo/'))
+
+
+class ReferenceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.git_path = os.path.join(self.test_root_path, "gitrepo")
+        _create_git_repo(self.git_path)
+        subprocess.check_call(["git", "tag", "1.0.0"], cwd=self.git_path)
+        self.cache_path = os.path.join(self.test_root_path, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_clone_from_mirror(self):
+        for workspace in ['ws1', 'ws2']:
+            # a new cache instance per run, as for separate processes
+            session = CheckoutSession(cache=ReferenceCache(self.cache_path))
+            path = os.path.join(self.test_root_path, workspace, 'repo')
+            self.assertTrue(session.checkout('git', path, self.git_path, '1.0.0'))
+            self.assertEqual(1, session.cached)
+            self.assertTrue(os.path.isfile(os.path.join(path, 'gitfixed.txt')))
+            origin = subprocess.check_output(["git", "config", "remote.origin.url"], cwd=path)
+            self.assertEqual(self.git_path, origin.decode('utf-8').strip())
+            # new upstream commits reach the mirror on the next run
+            subprocess.check_call(["git", "commit", "--allow-empty", "-m", workspace],
+                                  cwd=self.git_path)
+        mirror_path = ReferenceCache(self.cache_path).get_mirror_path(self.git_path)
+        log = subprocess.check_output(["git", "log", "--oneline", "--all"], cwd=mirror_path)
+        self.assertTrue(b'ws1' in log, log)
+
+    def test_fallback_without_mirror(self):
+        cache = ReferenceCache(self.cache_path)
+        path = os.path.join(self.test_root_path, 'ws', 'repo')
+        self.assertFalse(cache.clone(os.path.join(self.test_root_path, 'nosuchrepo'),
+                                     path, None))
+        self.assertFalse(os.path.exists(path))
+
+    def test_prune_lru(self):
+        cache = ReferenceCache(self.cache_path, max_size=0)
+        other_path = os.path.join(self.test_root_path, "otherrepo")
+        _create_git_repo(other_path)
+        self.assertTrue(cache.update_mirror(self.git_path))
+        self.assertTrue(cache.update_mirror(other_path))
+        old_mirror = cache.get_mirror_path(self.git_path)
+        os.utime(old_mirror, (0, 0))
+        # mirrors locked by other processes are left alone
+        with open(cache.get_mirror_path(other_path) + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_SH)
+            self.assertEqual([old_mirror], cache.prune())
+        self.assertTrue(os.path.isdir(cache.get_mirror_path(other_path)))
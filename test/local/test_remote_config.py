@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from wstool.common import MultiProjectException
+from rosinstall.remote_config import SourceCache, download_source, \
+    fetch_remote_uris, get_config, is_remote_uri
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    # path -> body, set by the test
+    sources = {}
+    lock = threading.Lock()
+    active = [0, 0]
+    etag = '"v1"'
+    statuses = []
+
+    def do_GET(self):
+        with self.lock:
+            self.active[0] += 1
+            self.active[1] = max(self.active)
+        time.sleep(0.2)
+        with self.lock:
+            self.active[0] -= 1
+        body = self.sources.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), SourceHandler)
+        # one thread per request, as a real server would serve them
+        self.server.process_request = lambda request, address: threading.Thread(
+            target=HTTPServer.process_request, args=(self.server, request, address)).start()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        SourceHandler.active[:] = [0, 0]
+        SourceHandler.statuses[:] = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_root_path)
+
+    def test_is_remote_uri(self):
+        self.assertTrue(is_remote_uri('https://example.com/a.rosinstall'))
+        self.assertFalse(is_remote_uri(self.test_root_path))
+        self.assertFalse(is_remote_uri('relative/file.rosinstall'))
+
+    def test_fetch_in_order(self):
+        SourceHandler.sources = dict([('/%d' % index, ('- other: {local-name: s%d}\n' % index).encode('utf-8'))
+                                      for index in range(4)])
+        local_file = os.path.join(self.test_root_path, 'local.rosinstall')
+        uris = ['%s/%d' % (self.url, index) for index in range(4)]
+        fetched = fetch_remote_uris(uris[:2] + [local_file] + uris[2:], self.test_root_path)
+        self.assertEqual(local_file, fetched[2])
+        for index, path in enumerate(fetched[:2] + fetched[3:]):
+            with open(path) as fhand:
+                self.assertEqual('- other: {local-name: s%d}\n' % index, fhand.read())
+        self.assertTrue(SourceHandler.active[1] > 1, SourceHandler.active)
+
+    def test_fetch_failure(self):
+        SourceHandler.sources = {}
+        try:
+            fetch_remote_uris(['%s/missing' % self.url], self.test_root_path)
+            self.fail('expected MultiProjectException')
+        except MultiProjectException as exc:
+            self.assertTrue('missing' in str(exc))
+
+    def test_get_config_shadowing(self):
+        SourceHandler.sources = {
+            '/first': b'- git: {local-name: repo, uri: /first/uri}\n- git: {local-name: only_first, uri: /only}\n',
+            '/second': b'- git: {local-name: repo, uri: /second/uri}\n'}
+        config = get_config(self.test_root_path,
+                            ['%s/first' % self.url, '%s/second' % self.url],
+                            config_filename='.rosinstall')
+        elements = dict([(element.get_local_name(), element)
+                         for element in config.get_config_elements()])
+        self.assertEqual(set(['repo', 'only_first']), set(elements.keys()))
+        self.assertEqual('/second/uri', elements['repo'].get_path_spec().get_uri())
+
+    def test_conditional_download(self):
+        SourceHandler.sources = {'/src': b'- other: {local-name: a}\n'}
+        cache = SourceCache(os.path.join(self.test_root_path, 'cache'))
+        uri = '%s/src' % self.url
+        try:
+            download_source(uri, cache, offline=True)
+            self.fail('expected MultiProjectException')
+        except MultiProjectException:
+            pass
+        self.assertEqual(b'- other: {local-name: a}\n', download_source(uri, cache))
+        self.assertEqual(b'- other: {local-name: a}\n', download_source(uri, cache))
+        self.assertEqual([200, 304], SourceHandler.statuses)
+        # changed on the server
+        SourceHandler.sources = {'/src': b'- other: {local-name: b}\n'}
+        SourceHandler.etag = '"v2"'
+        try:
+            self.assertEqual(b'- other: {local-name: b}\n', download_source(uri, cache))
+        finally:
+            SourceHandler.etag = '"v1"'
+        self.server.shutdown()
+        self.assertEqual(b'- other: {local-name: b}\n', download_source(uri, cache, offline=True))
@@ -89,6 +89,26 @@ class RosinstallCommandlineTest(AbstractFakeRosBasedTest):
         config = FakeConfig([PathSpec(self.ros_path, 'git', 'gituri', path=self.ros_path)])
         self.assertTrue(rosinstall.rosinstall_cmd._ros_requires_boostrap(config))
 
+    def test_bootstrap_fingerprint(self):
+        comm_path = os.path.join(self.directory, "ros_comm")
+        subprocess.check_call(["git", "clone", "-q", self.git_path, comm_path])
+        config = FakeConfig(celts=[MockConfigElement(path=comm_path, scmtype='git',
+                                                     spec=PathSpec('ros_comm', 'git', self.git_path))],
+                            basepath=self.directory)
+        cmd = 'rosmake ros'
+        fingerprint = rosinstall.rosinstall_cmd._get_bootstrap_fingerprint(config, cmd)
+        self.assertEqual(fingerprint, rosinstall.rosinstall_cmd._get_bootstrap_fingerprint(config, cmd))
+        self.assertNotEqual(fingerprint, rosinstall.rosinstall_cmd._get_bootstrap_fingerprint(config, 'rosmake ros --rosdep-yes'))
+        self.assertFalse(rosinstall.rosinstall_cmd._is_bootstrap_current(config, cmd))
+        rosinstall.rosinstall_cmd._record_bootstrap(config, cmd)
+        self.assertTrue(rosinstall.rosinstall_cmd._is_bootstrap_current(config, cmd))
+        # local changes and new commits invalidate the bootstrap
+        with open(os.path.join(comm_path, 'gitfixed.txt'), 'a') as fhand:
+            fhand.write('changed')
+        self.assertFalse(rosinstall.rosinstall_cmd._is_bootstrap_current(config, cmd))
+        subprocess.check_call(["git", "commit", "-q", "-a", "-m", "change"], cwd=comm_path)
+        self.assertFalse(rosinstall.rosinstall_cmd._is_bootstrap_current(config, cmd))
+
 
 class RosinstallCommandLineGenerationTest(AbstractFakeRosBasedTest):
 
@@ -31,6 +31,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import sys
 import copy
 import yaml
 import subprocess
@@ -39,6 +40,9 @@ import tempfile
 import rosinstall
 import rosinstall.helpers
 from rosinstall.rosinstall_cli import rosinstall_main
+import wstool.multiproject_cmd
+
+from test.io_wrapper import StringIO
 
 from test.scm_test_base import AbstractRosinstallBaseDirTest, AbstractFakeRosBasedTest, _create_yaml_file, _create_config_elt_dict
 
@@ -110,6 +114,27 @@ class RosinstallCommandlineOverlays(AbstractFakeRosBasedTest):
         cmd.extend([self.new_directory, self.directory])
         self.assertTrue(rosinstall_main(cmd))
 
+    def test_Rosinstall_diff_status_parallel(self):
+        """streamed diff and status match wstool's"""
+        with open(os.path.join(self.directory, 'gitrepo', 'gitfixed.txt'), 'a') as fhand:
+            fhand.write('changed\n')
+        config = wstool.multiproject_cmd.get_config(self.directory, config_filename='.rosinstall')
+        diffs = [entry['diff'] for entry in wstool.multiproject_cmd.cmd_diff(config) if entry['diff']]
+        statuses = [entry['status'] for entry in wstool.multiproject_cmd.cmd_status(config) if entry['status']]
+        self.assertEqual(1, len(diffs))
+        for option, expected in [('--diff', '\n'.join(diffs) + '\n'),
+                                 ('--status', ''.join(statuses))]:
+            cmd = copy.copy(self.rosinstall_fn)
+            cmd.extend([self.directory, option])
+            if option == '--diff':
+                cmd.extend(['-j', '2'])
+            sys.stdout = output = StringIO()
+            try:
+                self.assertTrue(rosinstall_main(cmd))
+            finally:
+                sys.stdout = sys.__stdout__
+            self.assertEqual(expected, output.getvalue())
+
 
 class RosinstallCommandlineOverlaysWithSetup(AbstractFakeRosBasedTest):
     """test creating parallel rosinstall env with overlayed stacks"""
@@ -32,11 +32,13 @@
 
 import os
 import sys
+import json
 import subprocess
 import wstool
 import wstool.helpers
 from test.io_wrapper import StringIO
 import wstool.multiproject_cmd
+import yaml
 
 from test.scm_test_base import AbstractFakeRosBasedTest
 from rosinstall.rosws_cli import RoswsCLI
@@ -84,6 +86,44 @@ class RosWsTest(AbstractFakeRosBasedTest):
         self.assertTrue(os.path.exists(workspace))
         self.assertTrue(os.path.exists(os.path.join(workspace, '.rosinstall')))
 
+    def test_init_parallel_auto(self):
+        workspace = os.path.join(self.test_root_path, 'ws1e')
+        cli = RoswsCLI()
+        sys.stdout = output = StringIO()
+        try:
+            self.assertEqual(0, cli.cmd_init([workspace, self.simple_rosinstall, "-j", "auto"]))
+        finally:
+            sys.stdout = sys.__stdout__
+        self.assertTrue('Adaptive parallelism settled at' in output.getvalue())
+        self.assertTrue(os.path.isdir(os.path.join(workspace, 'gitrepo', '.git')))
+
+    def test_init_profile(self):
+        workspace = os.path.join(self.test_root_path, 'ws1p')
+        profile_path = os.path.join(self.test_root_path, 'init_profile.json')
+        cli = RoswsCLI()
+        self.assertEqual(0, cli.cmd_init([workspace, self.simple_rosinstall, "--profile", profile_path]))
+        with open(profile_path) as fhand:
+            data = json.load(fhand)
+        self.assertEqual('rosws init', data['command'])
+        self.assertEqual(['config', 'install', 'setup'], [phase['name'] for phase in data['phases']])
+        self.assertEqual(set(['ros', 'gitrepo']), set([entry['localname'] for entry in data['entries']]))
+
+    def test_update_profile(self):
+        workspace = os.path.join(self.test_root_path, 'ws1u')
+        profile_path = os.path.join(self.test_root_path, 'update_profile.json')
+        cli = RoswsCLI()
+        self.assertEqual(0, cli.cmd_init([workspace, self.simple_rosinstall]))
+        install_or_update = wstool.multiproject_cmd.cmd_install_or_update
+        # options of rosinstall and wstool mixed
+        self.assertEqual(0, cli.cmd_update(workspace, ['--profile', profile_path, '-j', 'auto',
+                                                       '--continue-on-error', 'gitrepo']))
+        self.assertEqual(install_or_update, wstool.multiproject_cmd.cmd_install_or_update)
+        with open(profile_path) as fhand:
+            data = json.load(fhand)
+        self.assertEqual('rosws update', data['command'])
+        self.assertEqual(['config', 'install'], [phase['name'] for phase in data['phases']])
+        self.assertEqual(['gitrepo'], [entry['localname'] for entry in data['entries']])
+
     def test_merge(self):
         workspace = os.path.join(self.test_root_path, 'ws2')
         cli = RoswsCLI()
@@ -286,6 +326,20 @@ class RosWsTest(AbstractFakeRosBasedTest):
         output = output.getvalue()
         self.assertEqual('git,ros\ngit,gitrepo', output.strip())
 
+    def test_info_yaml_parallel(self):
+        workspace = os.path.join(self.test_root_path, 'ws7y')
+        cli = RoswsCLI()
+        self.assertEqual(0, cli.cmd_init([workspace, self.simple_rosinstall]))
+        config = wstool.multiproject_cmd.get_config(workspace, config_filename='.rosinstall')
+        expected = yaml.safe_dump(wstool.multiproject_cmd.cmd_snapshot(config))
+        for jobs in ['1', '4']:
+            sys.stdout = output = StringIO()
+            try:
+                self.assertEqual(0, cli.cmd_info(workspace, ['--yaml', '-j', jobs]))
+            finally:
+                sys.stdout = sys.__stdout__
+            self.assertEqual(expected, output.getvalue())
+
     def test_set_add_scm_change_localname(self):
         workspace = os.path.join(self.test_root_path, 'ws8')
         cli = RoswsCLI()
@@ -0,0 +1,357 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from wstool import multiproject_cmd
+from wstool.common import MultiProjectException
+from wstool.config_yaml import PathSpec
+
+from rosinstall.rosinstall_cmd import cmd_install_or_update, cmd_fetch, cmd_info, \
+    get_bootstrap_localnames, _iter_vcs_results
+from rosinstall.durations import DurationHistory
+from rosinstall.simple_checkout import checkout_rosinstall, iter_rosinstall_yaml, \
+    CheckoutSession, is_at_pinned_version
+from test.io_wrapper import StringIO
+from test.scm_test_base import _create_git_repo
+
+
+class SimpleCheckoutTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.git_path = os.path.join(self.test_root_path, "gitrepo")
+        _create_git_repo(self.git_path)
+        subprocess.check_call(["git", "tag", "release/foo/1.0.0"], cwd=self.git_path)
+        subprocess.check_call(["git", "tag", "release/bar/1.0.0"], cwd=self.git_path)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_checkout_parallel(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_parallel')
+        rosinstall_data = [{'git': {'local-name': os.path.join(ws_path, 'repo%s' % i),
+                                    'uri': self.git_path}}
+                           for i in range(4)]
+        checkout_rosinstall(rosinstall_data, num_threads=3)
+        for i in range(4):
+            self.assertTrue(os.path.isfile(os.path.join(ws_path, 'repo%s' % i, 'gitfixed.txt')))
+
+    def test_checkout_failure_summary(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_fail')
+        rosinstall_data = [{'git': {'local-name': os.path.join(ws_path, 'missing'),
+                                    'uri': os.path.join(self.test_root_path, 'nosuchrepo')}},
+                           {'git': {'local-name': os.path.join(ws_path, 'good'),
+                                    'uri': self.git_path}}]
+        try:
+            checkout_rosinstall(rosinstall_data, num_threads=2)
+            self.fail('expected MultiProjectException')
+        except MultiProjectException as mpe:
+            self.assertTrue('1 of the entries failed' in str(mpe), mpe)
+            # the git output is grouped with its entry
+            self.assertTrue("Command failed: 'git clone" in str(mpe), mpe)
+        self.assertTrue(os.path.isfile(os.path.join(ws_path, 'good', 'gitfixed.txt')))
+
+    def test_shared_uri_cloned_once(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_shared')
+        session = CheckoutSession()
+        for pkg in ['foo', 'bar']:
+            self.assertTrue(session.checkout('git', os.path.join(ws_path, pkg),
+                                             self.git_path, 'release/%s/1.0.0' % pkg))
+        self.assertEqual(1, session.reused)
+        self.assertTrue(session.saved_bytes > 0)
+        bar_path = os.path.join(ws_path, 'bar')
+        self.assertTrue(os.path.isfile(os.path.join(bar_path, 'gitfixed.txt')))
+        origin = subprocess.check_output(["git", "config", "remote.origin.url"], cwd=bar_path)
+        self.assertEqual(self.git_path, origin.decode('utf-8').strip())
+        self.assertTrue('Reused local clones for 1' in session.get_summary())
+
+    def test_reuse_relative_paths(self):
+        # as rosco checks out relative local names
+        ws_path = os.path.join(self.test_root_path, 'ws_relative')
+        os.makedirs(ws_path)
+        cwd = os.getcwd()
+        os.chdir(ws_path)
+        try:
+            session = CheckoutSession()
+            for pkg in ['foo', 'bar']:
+                self.assertTrue(session.checkout('git', pkg, self.git_path,
+                                                 'release/%s/1.0.0' % pkg))
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(1, session.reused)
+        self.assertTrue(os.path.isfile(os.path.join(ws_path, 'bar', 'gitfixed.txt')))
+
+    def test_shallow_checkout_and_update(self):
+        git_path = os.path.join(self.test_root_path, 'moving')
+        _create_git_repo(git_path)
+        subprocess.check_call(["git", "commit", "--allow-empty", "-m", "second"], cwd=git_path)
+        subprocess.check_call(["git", "tag", "release/foo/1.0.0"], cwd=git_path)
+        uri = 'file://' + git_path
+        ws_path = os.path.join(self.test_root_path, 'ws_shallow')
+        rosinstall_data = [{'git': {'local-name': os.path.join(ws_path, 'foo'),
+                                    'uri': uri, 'version': 'release/foo/1.0.0'}},
+                           {'git': {'local-name': os.path.join(ws_path, 'bar'),
+                                    'uri': uri, 'version': 'release/foo/1.0.0',
+                                    'meta': {'shallow': False}}}]
+        checkout_rosinstall(rosinstall_data, shallow=True)
+        foo_path = os.path.join(ws_path, 'foo')
+        count = subprocess.check_output(["git", "rev-list", "--count", "HEAD"], cwd=foo_path)
+        self.assertEqual(b'1', count.strip())
+        count = subprocess.check_output(["git", "rev-list", "--count", "HEAD"],
+                                        cwd=os.path.join(ws_path, 'bar'))
+        self.assertEqual(b'2', count.strip())
+        # moving the pinned tag must not break the shallow workspace
+        subprocess.check_call(["touch", "moved.txt"], cwd=git_path)
+        subprocess.check_call(["git", "add", "moved.txt"], cwd=git_path)
+        subprocess.check_call(["git", "commit", "-m", "third"], cwd=git_path)
+        subprocess.check_call(["git", "tag", "-f", "release/foo/1.0.0"], cwd=git_path)
+        session = CheckoutSession()
+        self.assertTrue(session.update('git', foo_path, 'release/foo/1.0.0'))
+        self.assertTrue(os.path.isfile(os.path.join(foo_path, 'moved.txt')))
+
+    def test_partial_checkout_commit_id(self):
+        sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.git_path)
+        sha = sha.decode('utf-8').strip()
+        path = os.path.join(self.test_root_path, 'ws_partial', 'foo')
+        session = CheckoutSession(partial=True)
+        self.assertTrue(session.checkout('git', path, 'file://' + self.git_path, sha))
+        self.assertTrue(os.path.isfile(os.path.join(path, 'gitfixed.txt')))
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=path)
+        self.assertEqual(sha, head.decode('utf-8').strip())
+
+    def test_shallow_checkout_falls_back_to_full_clone(self):
+        # git cannot fetch abbreviated commit ids
+        sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.git_path)
+        sha = sha.decode('utf-8').strip()
+        path = os.path.join(self.test_root_path, 'ws_abbrev', 'foo')
+        session = CheckoutSession(shallow=True)
+        self.assertTrue(session.checkout('git', path, 'file://' + self.git_path, sha[:8]))
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=path)
+        self.assertEqual(sha, head.decode('utf-8').strip())
+
+    def test_shallow_checkout_error_output(self):
+        path = os.path.join(self.test_root_path, 'ws_missing', 'foo')
+        session = CheckoutSession(shallow=True)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertFalse(session.checkout(
+                'git', path, os.path.join(self.test_root_path, 'missing'), 'master'))
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue('git clone -q --depth 1 --branch master' in output, output)
+        self.assertFalse(os.path.exists(path))
+
+    def test_is_at_pinned_version(self):
+        sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.git_path)
+        sha = sha.decode('utf-8').strip()
+        self.assertTrue(is_at_pinned_version('git', self.git_path, sha))
+        self.assertTrue(is_at_pinned_version('git', self.git_path, sha[:8]))
+        self.assertTrue(is_at_pinned_version('git', self.git_path, 'release/foo/1.0.0'))
+        branch = subprocess.check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"],
+                                         cwd=self.git_path)
+        self.assertFalse(is_at_pinned_version('git', self.git_path,
+                                              branch.decode('utf-8').strip()))
+        self.assertFalse(is_at_pinned_version('git', self.git_path, None))
+        self.assertFalse(is_at_pinned_version('git', self.test_root_path, sha))
+
+    def test_update_skips_pinned(self):
+        git_path = os.path.join(self.test_root_path, 'pinned')
+        _create_git_repo(git_path)
+        subprocess.check_call(["git", "tag", "1.0.0"], cwd=git_path)
+        ws_path = os.path.join(self.test_root_path, 'ws_pinned')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        config.add_path_spec(PathSpec('foo', 'git', git_path, '1.0.0'))
+        self.assertTrue(cmd_install_or_update(config))
+
+        def get_update_output(**kwargs):
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                self.assertTrue(cmd_install_or_update(config, **kwargs))
+                return sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+        output = get_update_output()
+        self.assertTrue('[foo] Already at pinned version 1.0.0' in output, output)
+        self.assertFalse('Updating' in output, output)
+        output = get_update_output(force_update=True)
+        self.assertTrue('[foo] Updating' in output, output)
+
+    def test_prepare_install_modes(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_modes')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        config.add_path_spec(PathSpec('foo', 'git', self.git_path))
+        # not a checkout of the configured repository
+        os.makedirs(os.path.join(ws_path, 'foo'))
+        self.assertRaises(MultiProjectException, cmd_install_or_update, config, mode='abort')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertTrue(cmd_install_or_update(config, mode='skip'))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('Skipping install of foo' in output, output)
+        self.assertTrue(cmd_install_or_update(config, mode='delete'))
+        self.assertTrue(os.path.isfile(os.path.join(ws_path, 'foo', 'gitfixed.txt')))
+
+    def test_priority_elements_first(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_priority')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        for name in ['foo', 'bar', 'ros']:
+            config.add_path_spec(PathSpec(name, 'git', self.git_path))
+        self.assertEqual(['ros'], get_bootstrap_localnames(config))
+        present = []
+
+        def on_priority_done():
+            present.extend([name for name in ['foo', 'bar', 'ros']
+                            if os.path.exists(os.path.join(ws_path, name))])
+        self.assertTrue(cmd_install_or_update(config,
+                                              priority_localnames=['ros'],
+                                              on_priority_done=on_priority_done))
+        self.assertEqual(['ros'], present)
+        self.assertTrue(os.path.isdir(os.path.join(ws_path, 'bar')))
+
+    def test_durations_recorded(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_durations')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        for name in ['foo', 'bar']:
+            config.add_path_spec(PathSpec(name, 'git', self.git_path))
+        self.assertTrue(cmd_install_or_update(config, num_threads=2))
+        history = DurationHistory(ws_path)
+        self.assertEqual(set(['foo', 'bar']), set(history.entries.keys()))
+        self.assertTrue('checkout' in history.entries['foo'])
+        self.assertTrue(cmd_install_or_update(config, num_threads=2, force_update=True))
+        self.assertTrue('update' in DurationHistory(ws_path).entries['bar'])
+
+    def test_fetch_keeps_working_tree(self):
+        git_path = os.path.join(self.test_root_path, 'fetched')
+        _create_git_repo(git_path)
+        ws_path = os.path.join(self.test_root_path, 'ws_fetch')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        config.add_path_spec(PathSpec('foo', 'git', git_path))
+        config.add_path_spec(PathSpec('missing', 'git', git_path))
+        self.assertTrue(cmd_install_or_update(config, localnames=['foo']))
+        foo_path = os.path.join(ws_path, 'foo')
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=foo_path)
+        subprocess.check_call(["git", "commit", "--allow-empty", "-m", "new"], cwd=git_path)
+        subprocess.check_call(["git", "tag", "2.0.0"], cwd=git_path)
+        config.add_path_spec(PathSpec('bzrrepo', 'bzr', 'lp:foo'))
+        os.makedirs(os.path.join(ws_path, 'bzrrepo'))
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertTrue(cmd_fetch(config))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('[bzrrepo] skipped (no separate fetch for bzr)' in output, output)
+        self.assertEqual(head, subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                                       cwd=foo_path))
+        self.assertFalse(os.path.exists(os.path.join(ws_path, 'missing')))
+        subprocess.check_call(["git", "rev-parse", "-q", "--verify", "refs/tags/2.0.0"],
+                              cwd=foo_path)
+
+    def test_info_parallel_same_as_wstool(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_info')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        names = ['repo%s' % i for i in range(5)]
+        for name in names:
+            config.add_path_spec(PathSpec(name, 'git', self.git_path, 'release/foo/1.0.0'))
+        self.assertTrue(cmd_install_or_update(config, localnames=names[:4], num_threads=2))
+        with open(os.path.join(ws_path, 'repo1', 'modified.txt'), 'w') as fhand:
+            fhand.write('modified')
+        outputs = cmd_info(config, untracked=True, num_threads=3)
+        self.assertEqual(names, [output['localname'] for output in outputs])
+        expected = multiproject_cmd.cmd_info(config, untracked=True)
+        for output in expected + outputs:
+            output['entry'] = output['entry'].get_legacy_yaml()
+        self.assertEqual(expected, outputs)
+        self.assertTrue(outputs[1]['modified'])
+        self.assertFalse(outputs[4]['exists'])
+
+    def test_vcs_results_after_error(self):
+        ws_path = os.path.join(self.test_root_path, 'ws_results')
+        config = multiproject_cmd.get_config(ws_path, additional_uris=[], config_filename=None)
+        for name in ['foo', 'bar', 'baz']:
+            config.add_path_spec(PathSpec(name, 'git', self.git_path))
+
+        def get_name(element):
+            if element.get_local_name() == 'foo':
+                raise MultiProjectException('broken')
+            return element.get_local_name()
+        results = []
+        try:
+            for _, name in _iter_vcs_results(config, None, get_name, 2):
+                results.append(name)
+            self.fail('expected MultiProjectException')
+        except MultiProjectException as mpe:
+            self.assertTrue("'foo' : broken" in str(mpe), mpe)
+        self.assertEqual(['bar', 'baz'], results)
+
+
+class IterRosinstallYamlTest(unittest.TestCase):
+
+    def test_iter_block_style(self):
+        stream = io.StringIO(u"""# comment
+---
+- git:
+    local-name: foo
+    uri: http://example.com/foo.git
+
+- svn: {local-name: bar, uri: 'http://example.com/bar'}
+- other:
+    local-name: baz
+""")
+        self.assertEqual([{'git': {'local-name': 'foo', 'uri': 'http://example.com/foo.git'}},
+                          {'svn': {'local-name': 'bar', 'uri': 'http://example.com/bar'}},
+                          {'other': {'local-name': 'baz'}}],
+                         list(iter_rosinstall_yaml(stream)))
+
+    def test_iter_is_incremental(self):
+        stream = io.StringIO(u"- other: {local-name: foo}\n- other: {local-name: bar}\n- other: {local-name: baz}\n")
+        entries = iter_rosinstall_yaml(stream)
+        self.assertEqual({'other': {'local-name': 'foo'}}, next(entries))
+        # first entry is available before the rest of the input was read
+        self.assertEqual(u"- other: {local-name: baz}\n", stream.read())
+
+    def test_iter_documents_and_comments(self):
+        stream = io.StringIO(u"""- other: {local-name: foo}
+# top-level comment
+- other:
+# comment inside the item
+    local-name: bar
+...
+---
+  - other: {local-name: baz}
+
+  # indented top-level comment
+  - other: {local-name: qux}
+--- # another document
+- other: {local-name: quux}""")
+        self.assertEqual(['foo', 'bar', 'baz', 'qux', 'quux'],
+                         [entry['other']['local-name'] for entry in iter_rosinstall_yaml(stream)])
+
+    def test_iter_dispatches_at_document_end(self):
+        stream = io.StringIO(u"- other: {local-name: foo}\n...\n- other: {local-name: bar}\n")
+        entries = iter_rosinstall_yaml(stream)
+        self.assertEqual({'other': {'local-name': 'foo'}}, next(entries))
+        self.assertEqual(u"- other: {local-name: bar}\n", stream.read())
+
+    def test_iter_flow_style_and_invalid(self):
+        stream = io.StringIO(u"[{other: {local-name: foo}}]")
+        self.assertEqual([{'other': {'local-name': 'foo'}}],
+                         list(iter_rosinstall_yaml(stream)))
+        self.assertEqual([], list(iter_rosinstall_yaml(io.StringIO(u""))))
+        self.assertRaises(MultiProjectException, list,
+                          iter_rosinstall_yaml(io.StringIO(u"foo: bar")))
+        self.assertRaises(MultiProjectException, list,
+                          iter_rosinstall_yaml(io.StringIO(u"- foo: [bar\n")))
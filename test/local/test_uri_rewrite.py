@@ -0,0 +1,112 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from wstool.common import MultiProjectException
+
+from rosinstall.simple_checkout import CheckoutSession, _set_hgrc_default
+from rosinstall.uri_rewrite import UriRewriter, load_rewrite_rules
+from test.scm_test_base import _create_git_repo
+
+
+class UriRewriterTest(unittest.TestCase):
+
+    def test_longest_prefix(self):
+        rewriter = UriRewriter([('https://github.com/', 'http://mirror/gh/'),
+                                ('https://github.com/ros/', 'http://mirror/ros/')])
+        self.assertEqual(('http://mirror/ros/ros.git',
+                          ('https://github.com/ros/', 'http://mirror/ros/')),
+                         rewriter.rewrite('https://github.com/ros/ros.git'))
+        self.assertEqual('http://mirror/gh/foo/bar',
+                         rewriter.rewrite('https://github.com/foo/bar')[0])
+        self.assertEqual(('http://example.com/x', None),
+                         rewriter.rewrite('http://example.com/x'))
+
+    def test_load_rules(self):
+        root = tempfile.mkdtemp()
+        try:
+            self.assertEqual(None, load_rewrite_rules(os.path.join(root, 'missing.yaml')))
+            rules_path = os.path.join(root, 'rules.yaml')
+            with open(rules_path, 'w') as rules_file:
+                rules_file.write('- {from: "https://github.com/", to: "/srv/mirror/"}\n')
+            rewriter = load_rewrite_rules(rules_path)
+            self.assertEqual('/srv/mirror/ros/ros',
+                             rewriter.rewrite('https://github.com/ros/ros')[0])
+            with open(rules_path, 'w') as rules_file:
+                rules_file.write('- {to: "/srv/mirror/"}\n')
+            self.assertRaises(MultiProjectException, load_rewrite_rules, rules_path)
+        finally:
+            shutil.rmtree(root)
+
+
+class HgrcTest(unittest.TestCase):
+
+    def test_set_default_keeps_settings(self):
+        root = tempfile.mkdtemp()
+        try:
+            hgrc = os.path.join(root, 'hgrc')
+            with open(hgrc, 'w') as hgrc_file:
+                hgrc_file.write('[ui]\nusername = me\n# comment\n'
+                                '[paths]\ndefault = http://old\n  continued\n'
+                                'other = http://other\n')
+            _set_hgrc_default(hgrc, 'http://new')
+            with open(hgrc) as hgrc_file:
+                self.assertEqual('[ui]\nusername = me\n# comment\n'
+                                 '[paths]\ndefault = http://new\n'
+                                 'other = http://other\n', hgrc_file.read())
+            hgrc = os.path.join(root, 'missing')
+            _set_hgrc_default(hgrc, 'http://new')
+            with open(hgrc) as hgrc_file:
+                self.assertEqual('[paths]\ndefault = http://new\n', hgrc_file.read())
+        finally:
+            shutil.rmtree(root)
+
+
+class RewriteCheckoutTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.upstream_path = os.path.join(self.test_root_path, "upstream", "repo")
+        _create_git_repo(self.upstream_path)
+        self.mirror_path = os.path.join(self.test_root_path, "mirror", "repo")
+        subprocess.check_call(["git", "clone", "-q", "--mirror",
+                               self.upstream_path, self.mirror_path])
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.test_root_path)
+
+    def _checkout(self, mirror_prefix, name):
+        rewriter = UriRewriter([(os.path.join(self.test_root_path, "upstream"),
+                                 mirror_prefix)])
+        session = CheckoutSession(rewriter=rewriter)
+        path = os.path.join(self.test_root_path, 'ws', name)
+        self.assertTrue(session.checkout('git', path, self.upstream_path, None))
+        self.assertTrue(os.path.isfile(os.path.join(path, 'gitfixed.txt')))
+        origin = subprocess.check_output(["git", "config", "remote.origin.url"], cwd=path)
+        self.assertEqual(self.upstream_path, origin.decode('utf-8').strip())
+        return session
+
+    def test_checkout_from_mirror(self):
+        session = self._checkout(os.path.join(self.test_root_path, "mirror"), 'mirrored')
+        self.assertEqual(0, session.rewrite_failures)
+        self.assertTrue('rewrite rule' in session.describe_rewrite(self.upstream_path))
+
+    def test_fallback_to_original(self):
+        session = self._checkout(os.path.join(self.test_root_path, "nosuchmirror"), 'fallback')
+        self.assertEqual(1, session.rewrite_failures)
+        self.assertTrue('used the original URIs' in session.get_summary())
+
+    def test_update_without_origin(self):
+        # origin does not exist, everything comes from the mirror
+        gone = os.path.join(self.test_root_path, "gone")
+        rewriter = UriRewriter([(gone, os.path.join(self.test_root_path, "mirror"))])
+        session = CheckoutSession(rewriter=rewriter)
+        path = os.path.join(self.test_root_path, 'ws', 'noorigin')
+        uri = os.path.join(gone, 'repo')
+        self.assertTrue(session.checkout('git', path, uri, None))
+        self.assertTrue(session.update('git', path, 'master', uri=uri))
+        self.assertEqual(0, session.rewrite_failures)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from wstool.common import MultiProjectException
+
+from rosinstall.simple_checkout import _checkout_entry
+from rosinstall.watchdog import _parse_cpu_time, find_entry_processes, run_with_timeouts
+
+
+class WatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_root_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_root_path, 'entry')
+        os.makedirs(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_root_path)
+
+    def test_parse_cpu_time(self):
+        self.assertEqual(5, _parse_cpu_time('00:05'))
+        self.assertEqual(3725, _parse_cpu_time('01:02:05'))
+        self.assertEqual(86400 + 60, _parse_cpu_time('1-00:01:00'))
+
+    def test_find_entry_processes(self):
+        entry = subprocess.Popen(['sh', '-c', 'sleep 30; true'], cwd=self.path)
+        other = subprocess.Popen(['sleep', '30'], cwd=self.test_root_path)
+        try:
+            time.sleep(0.5)
+            found = find_entry_processes(self.path)
+            self.assertTrue(entry.pid in found, found)
+            # the sleep child of the shell
+            self.assertEqual(2, len(found), found)
+            self.assertFalse(other.pid in found, found)
+        finally:
+            for process in [entry, other]:
+                process.kill()
+                process.wait()
+
+    def test_find_entry_processes_relative(self):
+        # like 'git clone <uri> entry' run next to the entry
+        entry = subprocess.Popen(['sh', '-c', 'sleep 30; true', 'entry'],
+                                 cwd=self.test_root_path)
+        try:
+            time.sleep(0.5)
+            self.assertTrue(entry.pid in find_entry_processes(self.path))
+        finally:
+            entry.kill()
+            entry.wait()
+
+    def test_checkout_relative_local_name(self):
+        class HungSession(object):
+            def describe_rewrite(self, uri):
+                return None
+
+            def checkout(self, scmtype, path, uri, version, tags=None):
+                # vcstools passes the path as given
+                return subprocess.call(['sh', '-c', 'sleep 30; true',
+                                        os.path.relpath(path)]) == 0
+        cwd = os.getcwd()
+        os.chdir(self.test_root_path)
+        start = time.time()
+        try:
+            _checkout_entry({'git': {'local-name': 'entry', 'uri': 'http://example.com/entry'}},
+                            HungSession(), inactivity_timeout=1, retries=0)
+            self.fail("expected timeout")
+        except MultiProjectException as exc:
+            self.assertTrue('giving up after 1 attempts' in str(exc), exc)
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(time.time() - start < 20)
+
+    def test_retry_hung_entry(self):
+        attempts = []
+
+        def install():
+            attempts.append(time.time())
+            duration = 30 if len(attempts) == 1 else 0
+            if subprocess.call(['sleep', str(duration)], cwd=self.path) != 0:
+                raise MultiProjectException("Checkout failed")
+            return len(attempts)
+        start = time.time()
+        self.assertEqual(2, run_with_timeouts(install, 'entry', self.path,
+                                              inactivity_timeout=1, backoff=0))
+        self.assertTrue(time.time() - start < 20)
+
+    def test_give_up(self):
+        def install():
+            if subprocess.call(['sleep', '30'], cwd=self.path) != 0:
+                raise MultiProjectException("Checkout failed")
+        start = time.time()
+        try:
+            run_with_timeouts(install, 'entry', self.path,
+                              total_timeout=1, retries=1, backoff=0)
+            self.fail("expected timeout")
+        except MultiProjectException as exc:
+            self.assertTrue('giving up after 2 attempts' in str(exc), exc)
+        self.assertTrue(time.time() - start < 20)